@@ -53,6 +53,17 @@ def calculate_age(born):
     today = datetime.today()
     return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
 
+def wrong_form_dict(doc):
+    """
+    Wrong form document as a dict, with the image as base64 text for the templates
+    (newer uploads store raw JPEG bytes, older ones base64 text)
+    """
+    data = doc.to_dict()
+    for key in ('image', 'image_full'):
+        if isinstance(data.get(key), bytes):
+            data[key] = base64.b64encode(data[key]).decode('utf-8')
+    return data
+
 def format_timestamp_to_iso(timestamp_str):
     """
     Convert "25 March 2025 at 19:07:31 UTC+8" to "2025-03-25"
@@ -305,7 +316,7 @@ def main_home():
         # Get wrong forms for this session
         wrong_forms_ref = db.collection('wrong_forms').where('session_id', '==', session_id).stream()
         for wrong_form in wrong_forms_ref:
-            wrong_forms.append(wrong_form.to_dict())
+            wrong_forms.append(wrong_form_dict(wrong_form))
 
     prediction = predict()
 
@@ -475,7 +486,7 @@ def view_recording_details(session_id):
 
     # Fetch wrong forms for this session
     wrong_forms_ref = db.collection('wrong_forms').where('session_id', '==', session_id).stream()
-    wrong_forms = [wf.to_dict() for wf in wrong_forms_ref]
+    wrong_forms = [wrong_form_dict(wf) for wf in wrong_forms_ref]
     
     # Get the highest attempt number
     attempt_numbers = [int(wf['attempt_number']) for wf in wrong_forms if 'attempt_number' in wf]
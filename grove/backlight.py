@@ -6,7 +6,14 @@ pushup_count = 0
 is_counting_down = False
 special_message = None  # Holds (message1, message2)
 special_message_active = False
-display_lock = threading.Lock() # Prevents display conflicts
+display_lock = threading.Condition() # Guards the state below and wakes the renderer (re-entrant)
+
+# What should be on the display, only the renderer thread talks to the LCD
+ROWS, COLS = 2, 16
+target_rows = [" " * COLS] * ROWS  # Text wanted on each row
+target_rgb = (0, 0, 0)             # Backlight color wanted
+target_version = 0                 # Bumped on every change, the renderer draws the newest
+drawn_version = 0                  # Newest version on the display
 
 if sys.platform == 'uwp':
     import winrt_smbus as smbus
@@ -24,11 +31,8 @@ else:
 DISPLAY_RGB_ADDR = 0x62
 DISPLAY_TEXT_ADDR = 0x3e
 
-# Set backlight color
-def setRGB(r, g, b):
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 0, 0)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 1, 0)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 0x08, 0xaa)
+# Function to write the backlight color registers
+def write_rgb(r, g, b):
     bus.write_byte_data(DISPLAY_RGB_ADDR, 4, r)
     bus.write_byte_data(DISPLAY_RGB_ADDR, 3, g)
     bus.write_byte_data(DISPLAY_RGB_ADDR, 2, b)
@@ -37,24 +41,113 @@ def setRGB(r, g, b):
 def textCommand(cmd):
     bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x80, cmd)
 
-# Display text
-def setText(text):
+# Function to write characters at the cursor in one I2C transaction
+def write_chars(chars):
+    data = [ord(c) for c in chars]
+    if hasattr(bus, "write_i2c_block_data"):
+        bus.write_i2c_block_data(DISPLAY_TEXT_ADDR, 0x40, data)
+    else:
+        for byte in data:
+            bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x40, byte)
+
+# Function to lay text out as the display shows it
+def layout(text):
+    """Splits text into ROWS rows of COLS characters, wrapping at COLS and at newlines like the LCD."""
+    rows, row = [], ""
+    for c in text:
+        if c == '\n' or len(row) == COLS:
+            rows.append(row)
+            row = ""
+            if c == '\n':
+                continue
+        row += c
+    rows.append(row)
+    return [r.ljust(COLS)[:COLS] for r in (rows + [""] * ROWS)[:ROWS]]
+
+# Function to request a frame, returns straight away
+def show(text=None, rgb=None):
+    global target_rows, target_rgb, target_version
+    with display_lock:
+        if text is not None:
+            target_rows = layout(text)
+        if rgb is not None:
+            target_rgb = rgb
+        target_version += 1
+        display_lock.notify_all()
+
+# Function to wait until the latest requested frame is on the display
+def flush(timeout=1.0):
+    with display_lock:
+        version = target_version
+        display_lock.wait_for(lambda: drawn_version >= version, timeout)
+
+# Function to find the cells of a row that differ from what is shown
+def changed_runs(shown, wanted, max_gap=2):
+    """Returns (start column, text) runs to rewrite. Runs closer than max_gap unchanged cells are
+    merged, rewriting a couple of cells is cheaper than another cursor command."""
+    runs = []
+    for col in range(COLS):
+        if shown[col] == wanted[col]:
+            continue
+        if runs and col - (runs[-1][0] + len(runs[-1][1])) <= max_gap:
+            start = runs[-1][0]
+            runs[-1] = (start, wanted[start:col + 1])
+        else:
+            runs.append((col, wanted[col]))
+    return runs
+
+# Renderer thread: owns the LCD and keeps a shadow copy of what it shows
+def render_loop():
+    global drawn_version
+    # Initialise once, clearing is the only slow command and is never needed again
     textCommand(0x01)  # Clear display
     time.sleep(0.05)
     textCommand(0x08 | 0x04)  # Display ON, no cursor
     textCommand(0x28)  # 2-line display mode
     time.sleep(0.05)
-    count, row = 0, 0
-    for c in text:
-        if c == '\n' or count == 16:
-            count, row = 0, row + 1
-            if row == 2:
-                break
-            textCommand(0xc0)  # Move to second line
-            if c == '\n':
-                continue
-        count += 1
-        bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x40, ord(c))
+    bus.write_byte_data(DISPLAY_RGB_ADDR, 0, 0)
+    bus.write_byte_data(DISPLAY_RGB_ADDR, 1, 0)
+    bus.write_byte_data(DISPLAY_RGB_ADDR, 0x08, 0xaa)
+    shown_rows = [" " * COLS] * ROWS
+    shown_rgb = None
+
+    while True:
+        with display_lock:
+            display_lock.wait_for(lambda: target_version != drawn_version)
+            # Copy the whole frame at once so it is never drawn half old, half new
+            rows, rgb, version = list(target_rows), target_rgb, target_version
+
+        try:
+            if rgb != shown_rgb:
+                write_rgb(*rgb)
+                shown_rgb = rgb
+            for row, wanted in enumerate(rows):
+                for col, chars in changed_runs(shown_rows[row], wanted):
+                    textCommand(0x80 | (0x40 * row + col))  # Move the cursor to the run
+                    write_chars(chars)
+                shown_rows[row] = wanted
+        except Exception as e:
+            print(f"LCD render error: {e}")
+            # The screen is unknown now, redraw every cell and the colour on the retry
+            shown_rows = ["\0" * COLS] * ROWS
+            shown_rgb = None
+            time.sleep(0.1)
+            continue
+
+        with display_lock:
+            drawn_version = version
+            display_lock.notify_all()
+
+render_thread = threading.Thread(target=render_loop, name="lcd-renderer", daemon=True)
+render_thread.start()
+
+# Set backlight color
+def setRGB(r, g, b):
+    show(rgb=(r, g, b))
+
+# Display text
+def setText(text):
+    show(text)
         
 # Function to reset and turn off the display
 def reset_display():
@@ -63,25 +156,21 @@ def reset_display():
     is_counting_down = False
     time_remaining = 0
     
-    setRGB(0, 0, 0)
-    textCommand(0x01)
+    show("", (0, 0, 0))
 
 # Function to display the default message
 def display_default():
-    setRGB(200, 160, 30)
-    setText("Enter Push-up\nPosition.")
+    show("Enter Push-up\nPosition.", (200, 160, 30))
     
 # Function to display the no-user detected
 def display_nouserdetected():
-    setRGB(250, 20, 20)
-    setText("No user\ndetected!")
+    show("No user\ndetected!", (250, 20, 20))
 
 # Function to display the ready message
 def display_ready():
     global pushup_count, time_remaining
-    setRGB(0, 255, 0)
     text = f"Time:{time_remaining}|\nCount:{pushup_count}|Ready"
-    setText(text)
+    show(text, (0, 255, 0))
 
 # Function to start countdown
 def start_timer():
@@ -95,19 +184,11 @@ def start_timer():
 
     # Now set the countdown active and start the timer thread
     is_counting_down = True
-    message1 = ""
-    message2 = ""
 
     def timer_loop():
-        global time_remaining, special_message, special_message_active
+        global time_remaining
         while time_remaining > 0:
-            with display_lock:
-                if special_message_active and special_message:
-                    message1, message2 = special_message
-                    text = f"Time:{time_remaining}|{message1}\nCount:{pushup_count}|{message2}"
-                else:
-                    text = f"Time:{time_remaining}|\nCount:{pushup_count}|"
-            setText(text)
+            show_status()
             time.sleep(1)
             time_remaining -= 1
         is_counting_down = False
@@ -116,8 +197,8 @@ def start_timer():
     timer_thread = threading.Thread(target=timer_loop)
     timer_thread.start()
 
-# Function to update push-up count
-def count_pushup(count):
+# Function to update push-up count and the message next to it, without touching the display
+def note_pushup(count):
     global pushup_count, special_message, special_message_active
     
     if count == 1:
@@ -134,11 +215,15 @@ def count_pushup(count):
     # Update special message
     special_message = (message1, message2)
     special_message_active = True
-    
-    # Ensure display updates don't clash with timer thread
+
+# Function to show the current time, count and message
+def show_status():
+    # Text is built under the lock so the timer thread and rep updates can't interleave
     with display_lock:
-        text = f"Time:{time_remaining}|{message1}\nCount:{pushup_count}|{message2}"
-        setText(text)
-    
-    # Ensures display updates instantly
-    time.sleep(0.01)
+        message1, message2 = special_message if special_message_active and special_message else ("", "")
+        show(f"Time:{time_remaining}|{message1}\nCount:{pushup_count}|{message2}")
+
+# Function to update push-up count
+def count_pushup(count):
+    note_pushup(count)
+    show_status()
@@ -8,13 +8,10 @@ grovepi.pinMode(buzzer, "OUTPUT")
 # Buzz once
 def buzz_success():
     """Quick buzz for a successful push-up."""
-    start_time = time.monotonic()
-    
     grovepi.digitalWrite(buzzer, 1)
     print("buzz_success(): Buzzer On")
     
-    while time.monotonic() - start_time < 0.1:
-        pass
+    time.sleep(0.1)  # Sleep, not spin, the Pi 3 has MQTT and the display to serve
         
     grovepi.digitalWrite(buzzer, 0)
     print("buzz_success(): Buzzer Off")
@@ -23,24 +20,17 @@ def buzz_success():
 def buzz_failure():
     """Double quick buzz for an unsuccessful push-up."""
     for _ in range(2):
-        start_time = time.monotonic()
-        
         grovepi.digitalWrite(buzzer, 1)
         
-        while time.monotonic() - start_time < 0.1:
-            pass
+        time.sleep(0.1)
             
         grovepi.digitalWrite(buzzer, 0)
 
 # Long Buzz of 0.8 seconds
 def buzz_complete():
     """Long buzz for the end of the session."""
-    start_time = time.monotonic()
-    
     grovepi.digitalWrite(buzzer, 1)
-
-    while time.monotonic() - start_time < 0.8:
-        pass
+    time.sleep(0.8)
         
     grovepi.digitalWrite(buzzer, 0)
     
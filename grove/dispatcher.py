@@ -0,0 +1,91 @@
+import collections
+import threading
+
+# Routes device work off the MQTT network thread. Each device (display, LED, buzzer, ranger)
+# gets its own worker thread and queue, so a slow device only ever delays itself.
+
+
+class Ticket:
+    """Tracks the jobs submitted for one message and calls on_done once all of them ran or were dropped.
+
+    The submitter holds one count itself and releases it with finish() after submitting, so
+    on_done can't fire before every job is in.
+    """
+
+    def __init__(self, trace, on_done):
+        self.trace = trace        # proto.HopTrace the jobs mark their hops on
+        self.on_done = on_done
+        self.remaining = 1
+        self.lock = threading.Lock()
+
+    def add(self):
+        with self.lock:
+            self.remaining += 1
+
+    def finish(self):
+        with self.lock:
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done:
+            self.on_done(self.trace)
+
+
+class Lane:
+    """One device's worker thread.
+
+    Jobs run one at a time in the order submitted. With latest_only, jobs still waiting when a
+    newer one arrives are dropped: feedback for a rep that has already been superseded is only
+    delay.
+    """
+
+    def __init__(self, name, latest_only=False):
+        self.name = name
+        self.latest_only = latest_only
+        self.pending = collections.deque()  # (calls, hop, ticket)
+        self.changed = threading.Condition()
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.work_loop, name=f"device-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, calls, hop=None, ticket=None):
+        if ticket:
+            ticket.add()
+        with self.changed:
+            if self.latest_only:
+                while self.pending:
+                    _, _, stale = self.pending.popleft()
+                    self.dropped += 1
+                    if stale:
+                        stale.finish()
+            self.pending.append((calls, hop, ticket))
+            self.changed.notify()
+
+    def work_loop(self):
+        while True:
+            with self.changed:
+                self.changed.wait_for(lambda: self.pending)
+                calls, hop, ticket = self.pending.popleft()
+            try:
+                for call in calls:
+                    call()
+            except Exception as e:
+                print(f"{self.name}: {e}")
+            if ticket:
+                if hop:
+                    ticket.trace.mark(hop)
+                ticket.finish()
+
+
+class Dispatcher:
+    def __init__(self):
+        self.lanes = {}
+
+    def add_lane(self, name, latest_only=False):
+        self.lanes[name] = Lane(name, latest_only)
+
+    def submit(self, lane, *calls, hop=None, ticket=None):
+        """Queues calls to run back to back on the lane's thread and returns straight away.
+
+        hop is marked on the ticket's trace once they are done.
+        """
+        self.lanes[lane].submit(calls, hop, ticket)
@@ -12,12 +12,10 @@ pinMode(red_led, "OUTPUT")
 # Light up green LED
 def led_success():
     """Lights up the success LED briefly"""
-    start_time = time.monotonic()
     digitalWrite(green_led, 1)
     #print("Debug: Green LED (D2) On")
     
-    while time.monotonic() - start_time < 0.5:
-        pass
+    time.sleep(0.5)  # Sleep, not spin, the Pi 3 has MQTT and the display to serve
         
     digitalWrite(green_led, 0)
     #print("Debug: Green LED (D2) Off")
@@ -25,13 +23,10 @@ def led_success():
 # Light up red LED
 def led_failure():
     """Lights up the failure LED briefly"""
-    start_time = time.monotonic()
-    
     digitalWrite(red_led, 1)
     #print("Debug: Red LED (D3) On")
     
-    while time.monotonic() - start_time < 0.5:
-        pass
+    time.sleep(0.5)
         
     digitalWrite(red_led, 0)
     #print("Debug: Red LED (D3) Off")
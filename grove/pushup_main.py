@@ -1,17 +1,45 @@
 import paho.mqtt.client as mqtt
 import time
+import os
+from functools import partial
 import buzzer as buzzer
 import ranger as ranger
 import backlight as backlight
 import led as led
+import pushup_protocol as proto
+from dispatcher import Dispatcher, Ticket
 
-# Broker's (PI) static IP
-BROKER = "172.20.10.4"
-TOPIC = "pushup/status"
-DIRECTION_TOPIC = "pushup/direction"
+# Lane this Grove station belongs to when one Pi 5 runs several lanes (e.g. PUSHUP_LANE=2)
+LANE = os.environ.get("PUSHUP_LANE")
+TOPIC_PREFIX = proto.lane_prefix(LANE)
+TOPIC = TOPIC_PREFIX + proto.STATUS_TOPIC
+DIRECTION_TOPIC = TOPIC_PREFIX + proto.DIRECTION_TOPIC
+
+# Per-hop latency tracing for trace_collector.py on the camera Pi (PUSHUP_TRACE=1)
+TRACING = os.environ.get("PUSHUP_TRACE") == "1"
 
 # Global Variable
 current_direction = None
+receiver = proto.Receiver()  # Drops duplicated and out-of-order messages
+current_trace = None         # HopTrace of the message being handled, when tracing
+
+# Device work runs on per-device threads so on_message returns straight away. Stale display,
+# LED and buzzer feedback is dropped, ranger steps (baselines, start/stop) all run in order.
+devices = Dispatcher()
+devices.add_lane("display", latest_only=True)
+devices.add_lane("led", latest_only=True)
+devices.add_lane("buzzer", latest_only=True)
+devices.add_lane("ranger")
+
+# Function to note that the current message got past a hop
+def hop(name, t=None):
+    if current_trace:
+        current_trace.mark(name, t)
+
+# Function to publish a message's trace once all of its device work is done
+def publish_trace(trace):
+    trace.mark("handled")
+    client.publish(TOPIC_PREFIX + proto.TRACE_TOPIC, trace.to_json())
 
 # Function to connect to MQTT topic
 def on_connect(client, userdata, flags, rc):
@@ -20,74 +48,106 @@ def on_connect(client, userdata, flags, rc):
     # Clear retained message
     client.publish(TOPIC, payload="", retain=True)
     
-    client.subscribe(TOPIC)
-    client.subscribe(DIRECTION_TOPIC)
+    client.subscribe(TOPIC, qos=proto.SUBSCRIBE_QOS)
+    client.subscribe(DIRECTION_TOPIC, qos=proto.SUBSCRIBE_QOS)
+    if TRACING:
+        client.subscribe(TOPIC_PREFIX + proto.CLOCK_PING_TOPIC)
     
 # Function to receive message from MQTT publisher
 def on_message(client, userdata, message):
-    payload = message.payload.decode()
+    received_at = time.time()
     topic = message.topic
-    global current_direction
+    global current_direction, current_trace
     
+    if topic == TOPIC_PREFIX + proto.CLOCK_PING_TOPIC:
+        # Echo with our receive and send times so the collector can estimate the clock offset
+        t0 = message.payload.decode()
+        client.publish(TOPIC_PREFIX + proto.CLOCK_PONG_TOPIC, f"{t0},{received_at},{time.time()}")
+        return
+    
+    msg = proto.decode(message.payload)
+    if not receiver.accept(topic, msg):
+        return
+    payload = msg.kind
+    ticket = None
+    if TRACING and msg.seq is not None:
+        current_trace = proto.HopTrace(msg.seq, "pi3", payload)
+        hop("received", received_at)
+        ticket = Ticket(current_trace, publish_trace)
     print(f"\nReceived: {payload}")
     
     if topic == DIRECTION_TOPIC:
         ranger.current_direction_subscribe(payload)
+        hop("direction")
+    
+    if payload in (proto.NO_USER, proto.END):
+        # Not queued: the ranger lane may be stuck in a baseline waiting for a user who has left
+        ranger.cancel_baselines()
     
-    if payload == "No user detected":
-        backlight.display_nouserdetected()
+    if payload == proto.NO_USER:
+        devices.submit("display", backlight.display_nouserdetected, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Backlight Display No User Detected\n")
         
-    elif payload == "User detected":
-        backlight.display_default()
+    elif payload == proto.USER_DETECTED:
+        devices.submit("display", backlight.display_default, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Backlight Display Default\n")
         
-    elif payload == "User in position":
-        backlight.display_ready()
+    elif payload == proto.USER_IN_POSITION:
+        devices.submit("display", backlight.display_ready, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Backlight Display Ready")
-        ranger.record_baseline_top()
-        print(f"{payload}: Baseline Top Recorded\n")
+        # Tagged with the session, so an END can cancel them while they wait for the user
+        session = ranger.baseline_session
+        devices.submit("ranger", partial(ranger.record_baseline_top, session), hop="baseline_top", ticket=ticket)
+        print(f"{payload}: Recording Baseline Top\n")
         
-    elif payload == "Start":
-        backlight.start_timer()
+    elif payload == proto.START:
+        backlight.start_timer()  # Only starts the timer thread, it draws the display itself
+        hop("lcd")
         print(f"{payload}: Timer Started")
-        ranger.record_baseline_bottom()
-        print(f"{payload}: Baseline Bottom Recorded")
-        ranger.start_pushup_monitoring()
-        print(f"{payload}: Start pushup monitoring\n")
+        session = ranger.baseline_session
+        devices.submit("ranger", partial(ranger.record_baseline_bottom, session), hop="baseline_bottom", ticket=ticket)
+        devices.submit("ranger", partial(ranger.start_pushup_monitoring, session), hop="monitoring", ticket=ticket)
+        print(f"{payload}: Recording Baseline Bottom, then start pushup monitoring\n")
         
-    elif payload == "Push up counted":
-        backlight.count_pushup(1)
+    elif payload == proto.PUSHUP_COUNTED:
+        backlight.note_pushup(1)  # Counted now, so a dropped display update can't lose a rep
+        devices.submit("display", backlight.show_status, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Push up counted")
-        buzzer.buzz_success()
+        devices.submit("buzzer", buzzer.buzz_success, buzzer.buzz_off, hop="buzzer", ticket=ticket)
         print(f"{payload}: Buzz Success")
-        buzzer.buzz_off()
-        led.led_success()
+        devices.submit("led", led.led_success, hop="led", ticket=ticket)
         print(f"{payload}: LED Success\n")
         
-    elif payload == "Straighten Back":
-        backlight.count_pushup(0)
+    elif payload == proto.STRAIGHTEN_BACK:
+        backlight.note_pushup(0)
+        devices.submit("display", backlight.show_status, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Push up not counted")
-        led.led_failure()
+        devices.submit("led", led.led_failure, hop="led", ticket=ticket)
         print(f"{payload}: LED Failure\n")
         
-    elif payload == "Straighten Arms":
-        backlight.count_pushup(2)
+    elif payload == proto.STRAIGHTEN_ARMS:
+        backlight.note_pushup(2)
+        devices.submit("display", backlight.show_status, backlight.flush, hop="lcd", ticket=ticket)
         print(f"{payload}: Push up not counted")
-        led.led_failure()
+        devices.submit("led", led.led_failure, hop="led", ticket=ticket)
         print(f"{payload}: LED Failure\n")
         
-    elif payload == "End":
-        ranger.stop_pushup_monitoring()
+    elif payload == proto.END:
+        devices.submit("ranger", ranger.stop_pushup_monitoring, hop="monitoring", ticket=ticket)
         print(f"{payload}: Stop pushup monitoring")
-        buzzer.buzz_off()
+        devices.submit("buzzer", buzzer.buzz_off, hop="buzzer", ticket=ticket)
         print(f"{payload}: Buzz End\n")
+    
+    if ticket:
+        hop("dispatched")
+        ticket.finish()  # Trace is published once the last device is done
+        current_trace = None
 
 
 # MQTT Client connectivity        
-client = mqtt.Client("Pi3Subscriber")
+client = mqtt.Client("Pi3Subscriber" + (f"-lane{LANE}" if LANE else ""))
 client.on_connect = on_connect
 client.on_message = on_message
-client.connect(BROKER, 1883)
+client.connect(proto.BROKER, proto.PORT)
 
 client.loop_forever()
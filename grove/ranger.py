@@ -1,18 +1,23 @@
 import RPi.GPIO as GPIO
 import time
 import threading
+import os
+from collections import namedtuple
 import paho.mqtt.client as mqtt
+import pushup_protocol as proto
+from reading_buffer import ReadingBuffer
 
 # Define GPIO pins for the HC-SR04P
 TRIG = 23  # GPIO23 (Pin 16)
 ECHO = 24  # GPIO24 (Pin 18)
 
 # MQTT Settings
-BROKER = "172.20.10.4"
-TOPIC = "pushup/badposture"
-mqtt_client = mqtt.Client("Pi3Publisher")
-mqtt_client.connect(BROKER, 1883)
+LANE = os.environ.get("PUSHUP_LANE")  # Same lane number as pushup_main
+TOPIC = proto.RANGER_TOPIC
+mqtt_client = mqtt.Client("Pi3Publisher" + (f"-lane{LANE}" if LANE else ""))
+mqtt_client.connect(proto.BROKER, proto.PORT)
 mqtt_client.loop_start()
+publisher = proto.Publisher(mqtt_client, proto.lane_prefix(LANE))
 
 # Global Variables
 pushup_enabled = False
@@ -22,69 +27,162 @@ baseline_bottom_distance = None
 TOLERANCE = 5
 MAX_DISTANCE = 300
 MIN_DISTANCE = 0
-DIRECTION_CHANGE_THRESHOLD = 2  # Minimum cm change to count as direction change
-CONSECUTIVE_WRONG_READINGS = 3  # Number of consecutive readings needed to confirm direction change
+PING_INTERVAL = 0.06  # Minimum seconds between pings so echoes of the last one have died out (HC-SR04 datasheet)
+ECHO_TIMEOUT = 0.03   # Longest wait for an echo, a 300 cm round trip takes ~17.5 ms
+SPEED_OF_SOUND = 34300  # cm/s
+SAMPLE_RATE = float(os.environ.get("PUSHUP_RANGER_HZ", "15"))  # Readings per second, PING_INTERVAL caps it at ~16
+MEDIAN_OF = 3         # Raw readings each filtered value is the median of, one bad echo can't get through
+EMA_ALPHA = 0.5       # Weight of the newest median in the exponential filter
+WINDOW = 0.4          # Seconds of readings direction checks look at
+DIRECTION_CHANGE_THRESHOLD = 2  # Minimum cm moved across WINDOW the wrong way to count as direction change
+CONFIDENCE = 2.0                # Standard errors the slope must clear the threshold by (~95%)
+MIN_SLOPE_READINGS = 4          # Readings needed in WINDOW before the slope is trusted
+CONSECUTIVE_WRONG_READINGS = 2  # Number of consecutive readings with a wrong slope needed to confirm direction change
 current_direction = None
 previous_direction = None
+direction_changed_at = 0.0  # perf_counter time of the last direction message that changed it
 consecutive_wrong_down = 0  # Track consecutive wrong readings when going down
 consecutive_wrong_up = 0    # Track consecutive wrong readings when going up
 pushup_in_progress = False
+baseline_session = 0  # Bumped when a session ends, baseline jobs queued for an earlier one give up
 bad_posture_flag = False
 pushup_depth_reached = False
 reached_top = False
 
+# Measurement state
+Reading = namedtuple("Reading", ["timestamp", "distance", "error"])  # perf_counter_ns, cm or None, why invalid
+echo_edges = []                # perf_counter_ns of the current ping's echo edges (rising, falling)
+echo_done = threading.Event()  # Set once both edges are in
+ping_lock = threading.Lock()   # One ping in flight at a time
+last_ping = 0                  # perf_counter_ns of the last trigger
+invalid_readings = 0
+
+# Function to timestamp echo edges, called from the RPi.GPIO event thread
+def on_echo(channel):
+    now = time.perf_counter_ns()
+    if len(echo_edges) < 2:
+        echo_edges.append(now)
+        if len(echo_edges) == 2:
+            echo_done.set()
+
 # Setup GPIO
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(TRIG, GPIO.OUT)
 GPIO.setup(ECHO, GPIO.IN)
+GPIO.output(TRIG, False)
+GPIO.add_event_detect(ECHO, GPIO.BOTH, callback=on_echo)
+
+# Function to take one ultrasonic measurement
+def measure():
+    """Pings once and returns a Reading. Sleeps instead of spinning, never longer than
+    PING_INTERVAL + ECHO_TIMEOUT. distance is None and error says why when the reading is invalid."""
+    global last_ping, invalid_readings
+    with ping_lock:
+        # Keep pings apart so this one can't pick up the previous one's echoes
+        wait = last_ping + int(PING_INTERVAL * 1e9) - time.perf_counter_ns()
+        if wait > 0:
+            time.sleep(wait / 1e9)
+
+        if GPIO.input(ECHO):
+            error = "echo stuck high"
+        else:
+            del echo_edges[:]
+            echo_done.clear()
+            GPIO.output(TRIG, True)
+            time.sleep(0.00001)  # 10µs pulse
+            GPIO.output(TRIG, False)
+            error = None if echo_done.wait(ECHO_TIMEOUT) else "no echo"
+        last_ping = time.perf_counter_ns()
+
+        if error is None:
+            pulse_start, pulse_end = echo_edges
+            distance = (pulse_end - pulse_start) / 1e9 * SPEED_OF_SOUND / 2  # Sound travels there and back
+            if MIN_DISTANCE < distance < MAX_DISTANCE:
+                return Reading(pulse_start, round(distance, 2), None)
+            error = f"out of range ({distance:.0f} cm)"
+
+    invalid_readings += 1
+    return Reading(last_ping, None, error)
 
 # Function to obtain distance using ultrasonic ranging module
 def get_distance():
-    """Measure distance using ultrasonic sensor."""
-    GPIO.output(TRIG, True)
-    time.sleep(0.00001)  # 10µs pulse
-    GPIO.output(TRIG, False)
+    """Measure distance using ultrasonic sensor. Returns None for an invalid reading."""
+    return measure().distance
 
-    # Wait for echo response
-    while GPIO.input(ECHO) == 0:
-        pulse_start = time.time()
-    while GPIO.input(ECHO) == 1:
-        pulse_end = time.time()
+# Filtered readings, shared by the sampler thread and the push-up checks
+samples = ReadingBuffer(median_of=MEDIAN_OF, alpha=EMA_ALPHA)
+
+# Function to keep the ring buffer filled, runs on its own thread for as long as the script runs
+def sample_loop():
+    period = 1.0 / SAMPLE_RATE
+    while True:
+        started = time.perf_counter()
+        reading = measure()
+        if reading.distance is not None:
+            samples.add(reading.timestamp / 1e9, reading.distance)
+        time.sleep(max(0.0, period - (time.perf_counter() - started)))
 
-    # Calculate distance
-    pulse_duration = pulse_end - pulse_start
-    distance = (pulse_duration * 34300) / 2  # Speed of sound is 343 m/s
+sampler_thread = threading.Thread(target=sample_loop, name="ranger-sampler", daemon=True)
+sampler_thread.start()
 
-    return round(distance, 2)
+# Function to get a distance from readings taken from now on
+def fresh_distance(n=MEDIAN_OF, session=None):
+    """Median of the next n raw readings, unaffected by where the user was before.
+    Returns None if the given session ended while waiting."""
+    values = []
+    after = time.perf_counter()
+    while len(values) < n:
+        if session_ended(session):
+            return None
+        latest = samples.wait(after, raw=True)
+        if latest is not None:
+            after, distance = latest
+            values.append(distance)
+    return round(sorted(values)[n // 2], 2)
 
 # Function to obtain current direction message from Pi 5
 def current_direction_subscribe(x):
-    global current_direction, reached_top
+    global current_direction, direction_changed_at, reached_top
+    if x != current_direction:
+        direction_changed_at = time.perf_counter()  # Same clock as the reading timestamps
     current_direction = x
-    if x == "down":
+    if x == proto.DOWN:
         reached_top = False
 
 # Function to record baseline top distance when user is doing their first push-up
-def record_baseline_top():
+def record_baseline_top(session=None):
     """Stores top (apex) position of push-up."""
     global baseline_top_distance
-    while True:
-        distance = get_distance()
-        if MIN_DISTANCE < distance < MAX_DISTANCE:
-            baseline_top_distance = distance
-            print(f"Baseline Top Distance: {baseline_top_distance} cm")
-            break
+    # Median of fresh readings, so the baseline isn't a single echo
+    distance = fresh_distance(session=session)
+    if distance is None:
+        print("Baseline Top cancelled")
+        return
+    baseline_top_distance = distance
+    print(f"Baseline Top Distance: {baseline_top_distance} cm")
 
 # Function to record baseline bottom distance when user is doing their first push-up
-def record_baseline_bottom():
+def record_baseline_bottom(session=None):
     """Stores bottom position of push-up."""
     global baseline_bottom_distance
-    while True:
-        distance = get_distance()
-        if MIN_DISTANCE < distance < 10:
+    # Waits for the user to get down, unless the session ends first
+    while not session_ended(session):
+        distance = fresh_distance(session=session)
+        if distance is not None and distance < 10:
             baseline_bottom_distance = distance
             print(f"Baseline Bottom Distance: {baseline_bottom_distance} cm")
-            break
+            return
+    print("Baseline Bottom cancelled")
+
+# Function to abandon the baselines when the session ends, called straight from the MQTT thread
+def cancel_baselines():
+    """Makes running or queued baseline jobs of the current session give up, so the ranger's queue moves on."""
+    global baseline_session
+    baseline_session += 1
+
+# Function to check whether a baseline job's session has ended, None is never cancelled
+def session_ended(session):
+    return session is not None and session != baseline_session
 
 # Function to reset baseline values
 def reset_baseline():
@@ -99,69 +197,70 @@ def check_pushup():
     global pushup_enabled, current_direction, previous_direction, bad_posture_flag
     global consecutive_wrong_down, consecutive_wrong_up, reached_top
     
-    previous_distance = None
+    last_time = time.perf_counter()
+    limit = DIRECTION_CHANGE_THRESHOLD / WINDOW  # cm/s
     
     while pushup_enabled:
-        distance = get_distance()
-        
-        # Skip invalid readings
-        if distance <= MIN_DISTANCE or distance >= MAX_DISTANCE:
-            time.sleep(0.05)
-            continue
-            
-        # Skip first reading
-        if previous_distance is None:
-            previous_distance = distance
-            time.sleep(0.05)
+        # Every new filtered reading from the sampler, invalid ones never reach the buffer
+        latest = samples.wait(last_time)
+        if latest is None:
             continue
+        last_time, distance = latest
+        distance = round(distance, 2)
         
         print(f"Distance: {distance} cm, Baseline Top: {baseline_top_distance} cm")
         # --- Reset after reaching top again ---
         if reached_top == False:
-            if abs(distance - baseline_top_distance) <= TOLERANCE and current_direction == "up":
+            if abs(distance - baseline_top_distance) <= TOLERANCE and current_direction == proto.UP:
                 reached_top = True
-                mqtt_client.publish(TOPIC, "Attempt counted")
+                publisher.send(TOPIC, proto.ATTEMPT_COUNTED)
                 print("Attempt counted")
                 
-        if abs(distance - baseline_bottom_distance) <= TOLERANCE and current_direction == "down":
+        if abs(distance - baseline_bottom_distance) <= TOLERANCE and current_direction == proto.DOWN:
             print("User at bottom")
-            mqtt_client.publish(TOPIC, "Bottom reached")
+            publisher.send(TOPIC, proto.BOTTOM_REACHED)
         
-        # Calculate the difference
-        diff = distance - previous_distance
+        if current_direction != previous_direction:
+            # New direction, the old one's wrong readings don't carry over
+            consecutive_wrong_down = consecutive_wrong_up = 0
+            previous_direction = current_direction
+        
+        # Direction of travel from the slope of the last WINDOW seconds of readings. Only readings
+        # since the last direction change count, before it the user was meant to move the other way
+        fit = samples.slope(WINDOW, MIN_SLOPE_READINGS, since=direction_changed_at)
+        if fit is None:
+            continue
+        rate, error = fit
         
-        if current_direction == "down":
-            # When going down, distance should DECREASE (negative diff)
-            # If it's increasing by more than threshold, that's wrong
-            if diff > DIRECTION_CHANGE_THRESHOLD:
+        if current_direction == proto.DOWN:
+            # When going down, distance should DECREASE (negative slope)
+            # Wrong if it is surely increasing, unless already within TOLERANCE of the bottom
+            if rate - CONFIDENCE * error > limit and distance - baseline_bottom_distance > TOLERANCE:
                 consecutive_wrong_down += 1
-                if consecutive_wrong_down >= CONSECUTIVE_WRONG_READINGS:
-                    print("Bad posture: Moving up while supposed to be going down")
-                    mqtt_client.publish(TOPIC, "Bad posture")
-                    consecutive_wrong_down = 0  # Reset after alerting
+                if consecutive_wrong_down == CONSECUTIVE_WRONG_READINGS:
+                    print(f"Bad posture: Moving up while supposed to be going down ({rate:+.1f} cm/s)")
+                    publisher.send(TOPIC, proto.BAD_POSTURE)
             else:
                 consecutive_wrong_down = 0  # Reset counter when movement is correct
                 
-        elif current_direction == "up":
-            # When going up, distance should INCREASE (positive diff)
-            # If it's decreasing by more than threshold, that's wrong
-            if diff < -DIRECTION_CHANGE_THRESHOLD:
+        elif current_direction == proto.UP:
+            # When going up, distance should INCREASE (positive slope)
+            # Wrong if it is surely decreasing, unless already within TOLERANCE of the top
+            if rate + CONFIDENCE * error < -limit and baseline_top_distance - distance > TOLERANCE:
                 consecutive_wrong_up += 1
-                if consecutive_wrong_up >= CONSECUTIVE_WRONG_READINGS:
-                    print("Bad posture: Moving down while supposed to be going up")
-                    mqtt_client.publish(TOPIC, "Bad posture")
-                    consecutive_wrong_up = 0  # Reset after alerting
+                if consecutive_wrong_up == CONSECUTIVE_WRONG_READINGS:
+                    print(f"Bad posture: Moving down while supposed to be going up ({rate:+.1f} cm/s)")
+                    publisher.send(TOPIC, proto.BAD_POSTURE)
             else:
                 consecutive_wrong_up = 0  # Reset counter when movement is correct
-            
-        previous_distance = distance
-        previous_direction = current_direction
-        time.sleep(0.15)  # Slightly longer delay to reduce noise
 
 # Function to start monitoring push-ups
-def start_pushup_monitoring():
+def start_pushup_monitoring(session=None):
     """Starts monitoring push-ups in a separate thread."""
     global pushup_enabled, pushup_thread
+    if session_ended(session):
+        print("Session ended before the baselines were recorded, not monitoring.")
+        return
     if not pushup_enabled:
         pushup_enabled = True
         pushup_thread = threading.Thread(target=check_pushup, daemon=True)
@@ -0,0 +1,115 @@
+import math
+import threading
+from array import array
+
+# Ranger readings for ranger.py, kept apart from the GPIO and MQTT setup so it can be tested off the Pi.
+
+
+class ReadingBuffer:
+    """Fixed-size ring of timestamped readings, backed by preallocated arrays.
+
+    Every reading is stored raw, as the median of the last median_of raw readings, and filtered:
+    that median smoothed with an exponential moving average. Queries use the filtered values,
+    except slope() which fits the medians (smoothing would turn a bad echo into a trend).
+    """
+
+    def __init__(self, size=64, median_of=3, alpha=0.5):
+        self.size = size
+        self.median_of = median_of
+        self.alpha = alpha
+        self.times = array("d", [0.0] * size)     # perf_counter seconds
+        self.raw = array("d", [0.0] * size)       # cm
+        self.medians = array("d", [0.0] * size)   # cm
+        self.filtered = array("d", [0.0] * size)  # cm
+        self.count = 0   # Readings added so far, the last size of them are kept
+        self.ema = None
+        self.changed = threading.Condition()
+
+    def clear(self):
+        with self.changed:
+            self.count = 0
+            self.ema = None
+
+    def add(self, t, distance):
+        with self.changed:
+            i = self.count % self.size
+            self.times[i] = t
+            self.raw[i] = distance
+            self.count += 1
+            recent = sorted(self.raw[(self.count - k) % self.size] for k in range(1, min(self.median_of, self.count) + 1))
+            median = self.medians[i] = recent[len(recent) // 2]
+            self.ema = median if self.ema is None else self.alpha * median + (1 - self.alpha) * self.ema
+            self.filtered[i] = self.ema
+            self.changed.notify_all()
+
+    def wait(self, after, timeout=1.0, raw=False):
+        """Blocks until there is a reading newer than time after. Returns its (time, cm) or None."""
+        with self.changed:
+            if not self.changed.wait_for(lambda: self.count and self.times[(self.count - 1) % self.size] > after, timeout):
+                return None  # Timed out, the newest reading was already handled
+            return self.latest(raw)
+
+    def latest(self, raw=False):
+        """(time, filtered cm) of the newest reading, or None. raw gives the unfiltered distance."""
+        with self.changed:
+            if not self.count:
+                return None
+            i = (self.count - 1) % self.size
+            return self.times[i], (self.raw if raw else self.filtered)[i]
+
+    def window(self, seconds, column=None, since=None):
+        """(times, filtered cm) of the readings from the last `seconds` before the newest one, oldest first.
+
+        column picks another of the buffer's arrays (raw or medians) instead of the filtered values.
+        since leaves out readings taken at or before that time.
+        """
+        column = self.filtered if column is None else column
+        with self.changed:
+            times, values = [], []
+            if self.count:
+                newest = self.times[(self.count - 1) % self.size]
+                for k in range(min(self.count, self.size), 0, -1):
+                    i = (self.count - k) % self.size
+                    if newest - self.times[i] <= seconds and (since is None or self.times[i] > since):
+                        times.append(self.times[i])
+                        values.append(column[i])
+            return times, values
+
+    def mean(self, seconds):
+        values = self.window(seconds)[1]
+        return sum(values) / len(values) if values else None
+
+    def median(self, seconds):
+        values = sorted(self.window(seconds)[1])
+        return values[len(values) // 2] if values else None
+
+    def velocity(self, seconds):
+        """cm/s over the window, positive when moving away from the sensor. None with under two readings."""
+        times, values = self.window(seconds)
+        if len(times) < 2 or times[-1] == times[0]:
+            return None
+        return (values[-1] - values[0]) / (times[-1] - times[0])
+
+    def slope(self, seconds, min_readings=4, since=None):
+        """Least-squares fit of the window's median readings against time.
+
+        Returns (slope cm/s, standard error of the slope) or None with under min_readings
+        readings. A real direction change gives a slope many standard errors from zero, jitter
+        and single bad echoes give a large standard error instead. since limits the fit to
+        readings taken after that time, as in window().
+        """
+        times, values = self.window(seconds, self.medians, since)
+        n = len(times)
+        if n < max(3, min_readings):
+            return None
+        mean_t = sum(times) / n
+        mean_v = sum(values) / n
+        sxx = sxy = 0.0
+        for t, v in zip(times, values):
+            sxx += (t - mean_t) ** 2
+            sxy += (t - mean_t) * (v - mean_v)
+        if sxx == 0:
+            return None
+        rate = sxy / sxx
+        residuals = sum((v - mean_v - rate * (t - mean_t)) ** 2 for t, v in zip(times, values))
+        return rate, math.sqrt(residuals / (n - 2) / sxx)
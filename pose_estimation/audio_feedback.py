@@ -0,0 +1,147 @@
+import os
+import re
+import itertools
+import threading
+import subprocess
+import time
+import pygame
+
+# Playback priorities, lower plays first
+HIGH = 0    # Session events ("You May Start", "Times Up"), interrupt whatever is playing
+NORMAL = 1  # Per-rep feedback (counts, "No Count", "Straighten Back")
+
+PHRASES = ["No Count", "Straighten Back", "You May Start", "Times Up"]
+
+
+def clip_name(text):
+    """File name of the cached clip for a phrase."""
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_") + ".wav"
+
+
+class AudioFeedback:
+    """Speaks feedback on a worker thread so the vision loop never waits on audio.
+
+    Every phrase is rendered once with espeak into a WAV file cache and kept in memory as a
+    pygame Sound, so playing a count is just a mixer call. Clips for the fixed phrases and the
+    numbers 1-100 are rendered in the background at startup; anything else is rendered on
+    first use.
+
+    Queue rules:
+        - HIGH clips stop the current clip and discard queued NORMAL clips.
+        - A new count replaces any count still waiting in the queue, only the latest is spoken.
+        - The queue is bounded, the oldest NORMAL clip is dropped when it overflows.
+    """
+
+    def __init__(self, cache_dir="voice_cache", max_number=100, max_queue=4, prerender=True):
+        self.cache_dir = cache_dir
+        self.max_number = max_number
+        self.max_queue = max_queue
+        self.clips = {}  # text -> pygame.mixer.Sound
+        self.pending = []  # (priority, seq, text), guarded by self.lock
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.interrupt = threading.Event()
+        self.running = True
+
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            pygame.mixer.init()
+            self.mixer_ok = True
+        except Exception as e:
+            # No audio device, fall back to calling espeak directly from the worker
+            print(f"Audio mixer unavailable, using espeak directly: {e}")
+            self.mixer_ok = False
+
+        self.worker = threading.Thread(target=self.play_loop, name="audio", daemon=True)
+        self.worker.start()
+        if prerender and self.mixer_ok:
+            threading.Thread(target=self.prerender, name="audio-prerender", daemon=True).start()
+
+    def say(self, text, priority=NORMAL):
+        """Queues a phrase and returns immediately."""
+        text = str(text)
+        with self.lock:
+            if priority == HIGH:
+                self.pending = [item for item in self.pending if item[0] == HIGH]
+                self.interrupt.set()
+            elif text.isdigit():
+                # Only the latest count is worth saying
+                self.pending = [item for item in self.pending if not item[2].isdigit()]
+
+            self.pending.append((priority, next(self.seq), text))
+            self.pending.sort()
+            while len(self.pending) > self.max_queue:
+                # Drop the oldest of the least important clips
+                worst = max(item[0] for item in self.pending)
+                oldest = next(item for item in self.pending if item[0] == worst)
+                self.pending.remove(oldest)
+        self.wakeup.set()
+
+    def stop(self):
+        self.running = False
+        self.interrupt.set()
+        self.wakeup.set()
+
+    # Clip cache
+    def prerender(self):
+        """Renders and loads every fixed phrase and count ahead of time."""
+        for text in PHRASES + [str(n) for n in range(1, self.max_number + 1)]:
+            if not self.running:
+                break
+            self.get_clip(text)
+
+    def get_clip(self, text):
+        """Returns the cached Sound for a phrase, rendering it on first use."""
+        clip = self.clips.get(text)
+        if clip is not None:
+            return clip
+
+        with self.render_lock:  # The prerender thread may be working on the same clip
+            clip = self.clips.get(text)
+            if clip is not None:
+                return clip
+            path = os.path.join(self.cache_dir, clip_name(text))
+            try:
+                if not os.path.exists(path):
+                    subprocess.run(["espeak", "-w", path, text], check=True,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                clip = pygame.mixer.Sound(path)
+            except Exception as e:
+                print(f"Error rendering clip '{text}': {e}")
+                return None
+            self.clips[text] = clip
+        return clip
+
+    # Worker
+    def next_item(self):
+        with self.lock:
+            self.interrupt.clear()
+            if self.pending:
+                return self.pending.pop(0)
+            self.wakeup.clear()
+        return None
+
+    def play_loop(self):
+        while self.running:
+            item = self.next_item()
+            if item is None:
+                self.wakeup.wait(timeout=0.5)
+                continue
+
+            priority, _, text = item
+            if not self.mixer_ok:
+                subprocess.call(["espeak", text])
+                continue
+
+            clip = self.get_clip(text)
+            if clip is None:
+                continue
+            channel = clip.play()
+            while channel is not None and channel.get_busy():
+                # HIGH clips cut NORMAL ones short, otherwise clips play to the end
+                if priority != HIGH and self.interrupt.is_set():
+                    channel.stop()
+                    break
+                time.sleep(0.02)
@@ -2,31 +2,71 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import uuid
 import cv2
-import base64
 import datetime
 import os  # Added for file path operations
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_LIMIT = 500               # Most writes Firestore accepts in one batch
+BATCH_BYTES = 9 * 1024 * 1024   # Stay under the 10 MiB request limit
 
 class FirestoreManager:
-    def __init__(self, credential_path="firebase-credentials.json"):
+    def __init__(self, credential_path="firebase-credentials.json", image_workers=4):
         """Initialize Firebase with the specified credentials.
         
+        When FIRESTORE_EMULATOR_HOST is set (e.g. "localhost:8080") the local Firestore emulator
+        is used instead and no credentials are needed.
+        
         Args:
             credential_path: Path to the Firebase credentials JSON file
+            image_workers: Threads used to prepare images and commit batches
         """
         self.initialized = False
+        self.credential_path = credential_path
+        self.image_workers = image_workers
+        self.connect()
+        
+    def connect(self):
+        """(Re)tries connecting, returns True once connected. Safe to call again after a failure."""
+        if self.initialized:
+            return True
         try:
-            cred = credentials.Certificate(credential_path)
-            if not firebase_admin._apps:
-                firebase_admin.initialize_app(cred)
-            self.db = firestore.client()
+            if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+                from google.auth.credentials import AnonymousCredentials
+                from google.cloud import firestore as cloud_firestore
+                project = os.environ.get("GCLOUD_PROJECT", "demo-pushup")
+                self.db = cloud_firestore.Client(project=project, credentials=AnonymousCredentials())
+            else:
+                cred = credentials.Certificate(self.credential_path)
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(cred)
+                self.db = firestore.client()
             self.initialized = True
             print("Firestore initialized successfully")
         except Exception as e:
             print(f"Firestore initialization error: {e}")
+        return self.initialized
             
             
             
-    def send_to_firebase(self, bad_form_images, session_stats=None, user_id="testing"):
+    def send_to_firebase(self, bad_form_images, session_stats=None, user_id="testing", thumbnails=None,
+                         session_id=None, timestamp=None, full_images=None):
+        """Uploads the session stats and its bad form images.
+        
+        Args:
+            bad_form_images: Paths of the saved bad form images
+            session_stats: Dict of session statistics
+            user_id: Username the session belongs to
+            thumbnails: Optional dict of image path -> ready-made JPEG thumbnail bytes,
+                images found here are not read back from disk
+            session_id: Session document ID to use, generated if not given. When given, the image
+                documents get IDs derived from it too, so retrying an upload overwrites instead of
+                duplicating
+            timestamp: When the session happened, defaults to now
+            full_images: Optional dict of image path -> full resolution JPEG bytes, uploaded
+                alongside the thumbnail as image_full
+        
+        Images are stored as raw JPEG bytes (Firestore bytes fields), not base64 text.
+        """
         if not self.initialized:
             print("Firestore not initialized")
             return {"success": False, "error": "Firestore not initialized"}
@@ -36,55 +76,117 @@ class FirestoreManager:
             "images_uploaded": 0,
             "failed_uploads": 0,
             "image_doc_ids": [],
-            "session_id": None
+            "session_id": None,
+            "documents": {}  # image path -> None if uploaded, else the error
         }
     
         # Create a session ID
-        session_id = str(uuid.uuid4())
+        retryable = session_id is not None
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
         
-        # Upload session stats first
+        # Session document goes into the first batch, so it is written before (or with) its images
+        writes = []  # (document ref, data, image path or None for the session)
         if session_stats:
-            try:
-                # Create session document
-                session_data = {
-                    'username': user_id,
-                    'session_id': session_id,
-                    'timestamp': datetime.datetime.now(),
-                    'stats': session_stats,
-                    'bad_form_count': len(bad_form_images),
-                    'completed': True
-                }
-                
-                # Add to sessions collection
-                session_ref = self.db.collection('sessions').document(session_id)
-                session_ref.set(session_data)
-                
-                results["session_id"] = session_id
-                print(f"Uploaded session with ID: {session_id}")
+            session_data = {
+                'username': user_id,
+                'session_id': session_id,
+                'timestamp': timestamp,
+                'stats': session_stats,
+                'bad_form_count': len(bad_form_images),
+                'completed': True
+            }
+            writes.append((self.db.collection('sessions').document(session_id), session_data, None))
+        
+        # Read, resize and encode the images on a bounded pool
+        collection = self.db.collection('wrong_forms')
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            payloads = list(pool.map(lambda item: self.prepare_image(item[1], thumbnails),
+                                     enumerate(bad_form_images)))
+        for index, (image_path, payload) in enumerate(zip(bad_form_images, payloads)):
+            if isinstance(payload, str):
+                print(f"Failed to prepare image {image_path}: {payload}")
+                results["failed_uploads"] += 1
+                results["documents"][image_path] = payload
+                continue
             
-            except Exception as e:
-                print(f"Error uploading session: {e}")
-                results["session_error"] = str(e)
-                results["success"] = False
-                return results  # If we can't create the session, no point continuing
+            # Create document data for wrong form image
+            attempt_num, issue_type, jpeg = payload
+            wrong_form_data = {
+                'username': user_id,
+                'session_id': session_id,
+                'timestamp': timestamp,
+                'form_issue': issue_type,
+                'attempt_number': attempt_num,
+                'image_path': image_path,
+                'image': jpeg
+            }
+            if full_images and image_path in full_images:
+                wrong_form_data['image_full'] = full_images[image_path]
+            doc_ref = collection.document(f"{session_id}-{index}") if retryable else collection.document()
+            writes.append((doc_ref, wrong_form_data, image_path))
         
-        # Process and upload each image
-        for image_path in bad_form_images:
-            try:
-                # Extract information from filename
-                filename = os.path.basename(image_path)
-                parts = filename.split('_')
-                
-                # Parse information from filename (attempt_NUM_ISSUE_TYPE_TIMESTAMP.jpg)
-                attempt_num = parts[1] if len(parts) > 1 else "unknown"
-                issue_type = parts[2] if len(parts) > 2 else "unknown"
-                
+        # Commit in as few batches as the Firestore limits allow
+        batches = self.split_batches(writes)
+        if not batches:
+            return results
+        
+        # The first batch holds the session, if it fails there is no point continuing
+        error = self.commit(batches[0])
+        if error and session_stats:
+            print(f"Error uploading session: {error}")
+            results["session_error"] = error
+            results["success"] = False
+            for batch in batches:
+                for _, _, image_path in batch:
+                    if image_path is not None:  # Every image is reported, not only the first batch's
+                        results["failed_uploads"] += 1
+                        results["documents"][image_path] = error
+            return results
+        outcomes = [(batches[0], error)]
+        if len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+                outcomes += zip(batches[1:], pool.map(self.commit, batches[1:]))
+        
+        for batch, error in outcomes:
+            for doc_ref, _, image_path in batch:
+                if image_path is None:
+                    results["session_id"] = session_id
+                    print(f"Uploaded session with ID: {session_id}")
+                elif error:
+                    print(f"Error uploading image {image_path}: {error}")
+                    results["failed_uploads"] += 1
+                    results["documents"][image_path] = error
+                else:
+                    results["images_uploaded"] += 1
+                    results["image_doc_ids"].append(doc_ref.id)
+                    results["documents"][image_path] = None
+        
+        print(f"Firebase upload complete: {results['images_uploaded']} images uploaded, {results['failed_uploads']} failed "
+              f"in {len(batches)} batch(es)")
+        return results
+
+    def prepare_image(self, image_path, thumbnails):
+        """Builds one image's upload payload. Returns (attempt, issue, JPEG bytes) or an error string."""
+        try:
+            # Extract information from filename
+            filename = os.path.basename(image_path)
+            parts = filename.split('_')
+            
+            # Parse information from filename (attempt_NUM_ISSUE_TYPE_TIMESTAMP.jpg)
+            attempt_num = parts[1] if len(parts) > 1 else "unknown"
+            issue_type = parts[2] if len(parts) > 2 else "unknown"
+            
+            if thumbnails and image_path in thumbnails:
+                # Thumbnail was already encoded by the snapshot writer
+                return attempt_num, issue_type, thumbnails[image_path]
+            else:
                 # Read the image
                 img = cv2.imread(image_path)
                 if img is None:
-                    print(f"Failed to read image: {image_path}")
-                    results["failed_uploads"] += 1
-                    continue
+                    return f"Failed to read image: {image_path}"
                 
                 # Resize image to reduce size before encoding
                 max_width = 320  # Limit width to control file size
@@ -95,33 +197,54 @@ class FirestoreManager:
                 
                 # Convert image to jpg buffer
                 _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                
-                # Convert to base64 string
-                img_str = base64.b64encode(buffer).decode('utf-8')
-                
-                # Create document data for wrong form image
-                wrong_form_data = {
-                    'username': user_id,
-                    'session_id': session_id,
-                    'timestamp': datetime.datetime.now(),
-                    'form_issue': issue_type,
-                    'attempt_number': attempt_num,
-                    'image_path': image_path,
-                    'image': img_str
-                }
-                
-                # Add to wrong_forms collection
-                doc_ref = self.db.collection('wrong_forms').document()
-                doc_ref.set(wrong_form_data)
-                
-                results["images_uploaded"] += 1
-                results["image_doc_ids"].append(doc_ref.id)
-                print(f"Uploaded bad form image: {image_path}")
-                
-            except Exception as e:
-                print(f"Error uploading image {image_path}: {e}")
-                results["failed_uploads"] += 1
+            
+            return attempt_num, issue_type, buffer.tobytes()
+        except Exception as e:
+            return str(e)
+
+    @staticmethod
+    def split_batches(writes):
+        """Groups writes into batches under both the write count and the request size limits."""
+        batches, batch, size = [], [], 0
+        for write in writes:
+            data = write[1]
+            doc_size = (len(data.get('image', b'')) + len(data.get('image_full', b''))
+                        + len(data.get('telemetry', b'')) + 1024)  # Blobs dominate
+            if batch and (len(batch) >= BATCH_LIMIT or size + doc_size > BATCH_BYTES):
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(write)
+            size += doc_size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def write_documents(self, documents):
+        """Writes (collection, document ID, data) tuples in as few batches as possible.
         
-        print(f"Firebase upload complete: {results['images_uploaded']} images uploaded, {results['failed_uploads']} failed")
-        return results
+        Returns a list with None for every document written and the error message for every
+        document that was not, in the same order as documents.
+        """
+        if not self.initialized:
+            return ["Firestore not initialized"] * len(documents)
+        writes = [(self.db.collection(collection).document(doc_id), data, i)
+                  for i, (collection, doc_id, data) in enumerate(documents)]
+        batches = self.split_batches(writes)
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            outcomes = list(zip(batches, pool.map(self.commit, batches)))
+        errors = [None] * len(documents)
+        for batch, error in outcomes:
+            for _, _, i in batch:
+                errors[i] = error
+        return errors
 
+    def commit(self, writes):
+        """Commits one batch atomically. Returns None on success or the error message."""
+        try:
+            batch = self.db.batch()
+            for doc_ref, data, _ in writes:
+                batch.set(doc_ref, data)
+            batch.commit()
+            return None
+        except Exception as e:
+            return str(e)
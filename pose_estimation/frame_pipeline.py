@@ -0,0 +1,140 @@
+import threading
+import queue
+import time
+from pose_estimation import ELBOW, SHOULDER, HIP, PUSHUP_ANGLES
+from metrics import get_timer
+
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item when full, so readers always get the freshest one."""
+
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0  # Number of stale items thrown away
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                # Drop the stale item and try again
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Returns the next item, or None if nothing arrived before the timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class FramePacket:
+    """A captured frame and everything the later stages attach to it."""
+
+    __slots__ = ("index", "timestamp", "img", "lmList", "angles")
+
+    def __init__(self, index, timestamp, img):
+        self.index = index          # Frame number from the capture stage
+        self.timestamp = timestamp  # time.time() when the frame was read
+        self.img = img
+        self.lmList = []            # Landmark rows from the inference stage (only len() is stable)
+        self.angles = None          # [elbow, shoulder, hip] when a valid pose was found
+
+
+class FramePipeline:
+    """Runs capture and pose inference on their own threads.
+
+    Stage 1 (capture) reads the camera as fast as it delivers and keeps only the newest frame.
+    Stage 2 (inference) runs MediaPipe on the newest frame and computes the key angles.
+    Stage 3 (state/feedback) is the caller, which pulls finished packets with get_result().
+    The stages are joined by LatestQueues, so a slow stage skips stale frames instead of lagging.
+    """
+
+    def __init__(self, cap, detector, valid_pose=None, draw=True, scheduler=None, recorder=None,
+                 metrics=None):
+        self.cap = cap
+        self.detector = detector
+        self.scheduler = scheduler  # Optional FrameScheduler that thins out inference between sessions
+        self.recorder = recorder    # Optional TraceWriter that logs every processed frame's landmarks
+        
+        # Stage timers (no-ops unless a StageMetrics is given)
+        self.t_capture = get_timer(metrics, "capture")
+        self.t_angles = get_timer(metrics, "angles")
+        detector.t_convert = get_timer(metrics, "convert")
+        detector.t_pose = get_timer(metrics, "pose")
+        self.valid_pose = valid_pose  # Callable(lmList) -> bool, angles are only computed when True
+        self.draw = draw  # Draw the key angles onto the frame for display
+        self.frames = LatestQueue(1)
+        self.results = LatestQueue(1)
+        self.running = False
+        self.finished = False  # Set once the camera stops delivering frames
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self.inference_loop, name="inference", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+
+    # Stage 1: grab frames and keep only the newest one
+    def capture_loop(self):
+        index = 0
+        while self.running and self.cap.isOpened():
+            with self.t_capture:
+                ret, img = self.cap.read()
+            if not ret:
+                break
+            self.frames.put(FramePacket(index, time.time(), img))
+            index += 1
+        self.finished = True
+        self.frames.put(None)  # Tell the inference stage there is nothing more coming
+
+    # Stage 2: pose inference and angle computation
+    def inference_loop(self):
+        while self.running:
+            packet = self.frames.get(timeout=0.5)
+            if packet is None:
+                if self.finished:
+                    break
+                continue
+
+            # Skip frames the scheduler doesn't need for the current session phase
+            if self.scheduler is not None and not self.scheduler.should_process(packet.img, packet.timestamp):
+                continue
+
+            img = self.detector.findPose(packet.img, False)
+            with self.t_angles:
+                packet.lmList = self.detector.findPosition(img, False)
+                if self.valid_pose is None or self.valid_pose(packet.lmList):
+                    # Elbow, shoulder and hip in one pass
+                    packet.angles = self.detector.findAngles(PUSHUP_ANGLES)
+            if self.recorder is not None:
+                self.recorder.write(packet.timestamp, packet.lmList)
+
+            if self.draw and packet.angles is not None:
+                for joint, angle in zip((ELBOW, SHOULDER, HIP), packet.angles):
+                    self.detector.drawAngle(img, *joint, angle)
+            self.results.put(packet)
+        self.results.put(None)
+
+    # Stage 3 entry point
+    def get_result(self, timeout=0.5):
+        """Returns the freshest processed FramePacket, or None if none is ready yet."""
+        return self.results.get(timeout=timeout)
+
+    def done(self):
+        """True once the camera has stopped and every frame has been drained."""
+        return self.finished and not any(t.is_alive() for t in self.threads)
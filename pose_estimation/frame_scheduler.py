@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+# Session phases, from least to most demanding
+IDLE = "idle"          # Nobody in front of the camera
+READY = "ready"        # User found, waiting for the 1.5 s hold in the UP position
+COUNTING = "counting"  # Session running, every frame matters
+
+
+class FrameScheduler:
+    """Decides which frames get pose inference based on the session phase.
+
+    While idle or waiting in the ready position inference runs at a low rate, which keeps the
+    Pi 5 cool between sessions. Once counting starts every frame is processed. In the idle phase
+    a cheap frame-difference check on a tiny greyscale copy wakes inference up immediately when
+    something moves in front of the camera.
+    """
+
+    def __init__(self, idle_fps=2, ready_fps=10, motion_gating=True, motion_threshold=6.0,
+                 motion_width=64):
+        """
+        Args:
+            idle_fps: Inference rate while nobody is detected
+            ready_fps: Inference rate while waiting for the ready position hold
+            motion_gating: Run inference straight away when motion is seen while idle
+            motion_threshold: Mean absolute grey level change (0-255) that counts as motion
+            motion_width: Width (px) of the greyscale copy used for the motion check
+        """
+        self.intervals = {
+            IDLE: 1.0 / idle_fps,
+            READY: 1.0 / ready_fps,
+            COUNTING: 0.0,
+        }
+        self.motion_gating = motion_gating
+        self.motion_threshold = motion_threshold
+        self.motion_width = motion_width
+        self.phase = IDLE
+        self.last_run = 0.0
+        self.prev_small = None
+
+    def set_phase(self, phase):
+        """Called by the state stage whenever it learns which phase the session is in."""
+        self.phase = phase
+
+    def should_process(self, img, now):
+        """Returns True if this frame should go through pose inference."""
+        if self.phase == COUNTING:
+            self.prev_small = None
+            self.last_run = now
+            return True
+
+        if self.phase == IDLE and self.motion_gating and self.motion(img):
+            self.last_run = now
+            return True
+
+        if now - self.last_run >= self.intervals[self.phase]:
+            self.last_run = now
+            return True
+        return False
+
+    def motion(self, img):
+        """Frame-difference motion check on a downscaled greyscale copy."""
+        h, w = img.shape[:2]
+        size = (self.motion_width, max(1, h * self.motion_width // w))
+        small = cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        prev, self.prev_small = self.prev_small, small
+        if prev is None:
+            return False
+        return float(np.mean(cv2.absdiff(small, prev))) > self.motion_threshold
@@ -0,0 +1,135 @@
+import os
+import struct
+import threading
+import numpy as np
+import pushup_protocol as proto
+
+MAGIC = b"PUTRACE1"
+VERSION = 1
+NUM_LANDMARKS = 33
+HEADER = struct.Struct("<8sHHI")  # magic, version, landmarks per frame, record size
+HEADER_SIZE = 64                  # Header is padded so records start on an aligned offset
+
+# Ranger events received over MQTT since the previous frame, stored as a bitmask
+EVENT_BAD_POSTURE = 1
+EVENT_ATTEMPT = 2
+EVENT_BOTTOM = 4
+EVENT_PAYLOADS = {
+    proto.BAD_POSTURE: EVENT_BAD_POSTURE,
+    proto.ATTEMPT_COUNTED: EVENT_ATTEMPT,
+    proto.BOTTOM_REACHED: EVENT_BOTTOM,
+}
+
+# One fixed-width record per processed frame. Fixed width keeps the file append-only and lets
+# a memory map expose every field as a column (e.g. trace.landmarks[:, 13, 1]) without parsing.
+RECORD = np.dtype([
+    ("t", "<f8"),                            # Frame timestamp (s)
+    ("valid", "u1"),                         # Number of landmarks found, 0 when no pose
+    ("events", "u1"),                        # EVENT_* bits
+    ("pad", "u1", (6,)),
+    ("lm", "<f4", (NUM_LANDMARKS, 4)),       # Pixel x, y, z and visibility
+])
+
+
+class TraceWriter:
+    """Appends per-frame landmarks and ranger events to a trace file while a session runs."""
+
+    def __init__(self, path, flush_every=30):
+        """
+        Args:
+            path: Trace file, created if missing and appended to otherwise
+            flush_every: Records buffered before they are flushed to disk
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.record = np.zeros(1, RECORD)  # Reused for every frame
+        self.pending_events = 0
+        self.lock = threading.Lock()
+        self.unflushed = 0
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            header = HEADER.pack(MAGIC, VERSION, NUM_LANDMARKS, RECORD.itemsize)
+            self.file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def add_event(self, payload):
+        """Notes a ranger message kind, safe to call from the MQTT thread."""
+        bit = EVENT_PAYLOADS.get(payload)
+        if bit:
+            with self.lock:
+                self.pending_events |= bit
+
+    def write(self, timestamp, landmarks):
+        """Appends one frame. landmarks is the poseDetector array view (empty when no pose)."""
+        with self.lock:
+            events, self.pending_events = self.pending_events, 0
+
+        rec = self.record[0]
+        rec["t"] = timestamp
+        rec["valid"] = len(landmarks)
+        rec["events"] = events
+        if len(landmarks):
+            rec["lm"][:len(landmarks)] = landmarks
+        else:
+            rec["lm"] = 0
+        self.file.write(self.record.tobytes())
+
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.file.flush()
+            self.unflushed = 0
+
+    def close(self):
+        self.file.flush()
+        self.file.close()
+
+
+class TraceReader:
+    """Memory-mapped view of a trace file. Columns are NumPy views, nothing is copied on open."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, num_landmarks, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"Not a supported landmark trace: {path}")
+
+        # A partly written last record (e.g. after a crash) is ignored
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamps(self):
+        return self.records["t"]
+
+    @property
+    def valid(self):
+        return self.records["valid"]
+
+    @property
+    def events(self):
+        return self.records["events"]
+
+    @property
+    def landmarks(self):
+        """N x 33 x 4 array of pixel x, y, z and visibility."""
+        return self.records["lm"]
+
+    @property
+    def visibility(self):
+        return self.records["lm"][:, :, 3]
+
+    def frames(self):
+        """Yields (timestamp, landmarks, event payloads) per frame, for streaming into the counter."""
+        empty = self.records["lm"][0, :0] if len(self.records) else np.zeros((0, 4), np.float32)
+        for rec in self.records:
+            valid = int(rec["valid"])
+            payloads = [p for p, bit in EVENT_PAYLOADS.items() if rec["events"] & bit]
+            yield float(rec["t"]), (rec["lm"][:valid] if valid else empty), payloads
@@ -0,0 +1,139 @@
+"""Runs several push-up lanes on one Pi 5, one worker process per camera.
+
+Each lane gets its own camera, CPU core, MQTT topic namespace (laneN/pushup/...), MQTT client ID,
+snapshot folder and session. Crashed workers are restarted with a backoff, and per-lane and
+total FPS are printed periodically so you can see how many lanes the box sustains.
+
+Usage:
+    python lane_supervisor.py --lane 0 --lane 2        # cameras 0 and 2 as lanes 1 and 2
+    python lane_supervisor.py --lane 0:1 --lane 2:3    # camera:core to choose the pinning
+    python lane_supervisor.py --lane 0 --lane 2 --headless --preview-port 8080  # lane N previews on 8080+N-1
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import time
+
+
+def run_lane(lane, camera, core, stats_queue, extra_args=()):
+    """Worker process entry point. extra_args are passed on to pushup_counter."""
+    if core is not None and hasattr(os, "sched_setaffinity"):
+        # MediaPipe's threads inherit this, so the whole lane stays on its core
+        os.sched_setaffinity(0, {core})
+
+    import pushup_counter as pc  # Imported here so each worker initialises its own OpenCV/MediaPipe
+    pc.main(pc.parse_args(["--camera", str(camera), "--lane", str(lane), *extra_args]), stats_queue)
+
+
+class Lane:
+    """Supervisor-side bookkeeping for one worker."""
+
+    def __init__(self, lane, camera, core):
+        self.lane = lane
+        self.camera = camera
+        self.core = core
+        self.process = None
+        self.restarts = 0
+        self.restart_at = 0.0  # Earliest time the next restart may happen
+        self.started_at = 0.0
+        self.fps = 0.0
+        self.phase = "-"
+        self.extra_args = []  # Per-lane pushup_counter options
+
+
+def parse_lanes(specs):
+    """Turns ["0", "2:3"] into Lane objects, assigning cores round-robin when not given."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else [None]
+    lanes = []
+    for i, spec in enumerate(specs):
+        camera, _, core = spec.partition(":")
+        lanes.append(Lane(i + 1, int(camera), int(core) if core else cores[i % len(cores)]))
+    return lanes
+
+
+def start(lane, ctx, stats_queue):
+    lane.process = ctx.Process(target=run_lane, name=f"lane{lane.lane}",
+                               args=(lane.lane, lane.camera, lane.core, stats_queue, lane.extra_args),
+                               daemon=True)
+    lane.process.start()
+    lane.started_at = time.time()
+    print(f"Lane {lane.lane}: started camera {lane.camera} on core {lane.core} (pid {lane.process.pid})")
+
+
+def supervise(lanes, report_every=5.0, max_backoff=30.0):
+    ctx = mp.get_context("spawn")
+    stats_queue = ctx.Queue(maxsize=256)
+    for lane in lanes:
+        start(lane, ctx, stats_queue)
+
+    by_id = {lane.lane: lane for lane in lanes}
+    next_report = time.time() + report_every
+    try:
+        while True:
+            # Collect FPS reports: wait for one, then take whatever else is already queued.
+            # Lanes report every second, so waiting until the queue stays empty never ends.
+            try:
+                report = stats_queue.get(timeout=0.5)
+                while True:
+                    lane_id, fps, phase = report
+                    by_id[lane_id].fps = fps
+                    by_id[lane_id].phase = phase
+                    report = stats_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            # Restart anything that died, backing off if it keeps crashing
+            now = time.time()
+            for lane in lanes:
+                if lane.process.is_alive():
+                    continue
+                if lane.restart_at == 0.0:
+                    if now - lane.started_at > 60:
+                        lane.restarts = 0  # Ran fine for a while, don't hold old crashes against it
+                    backoff = min(max_backoff, 2 ** lane.restarts)
+                    lane.restart_at = now + backoff
+                    lane.fps = 0.0
+                    lane.phase = "down"
+                    print(f"Lane {lane.lane}: exited with code {lane.process.exitcode}, restarting in {backoff:.0f}s")
+                elif now >= lane.restart_at:
+                    lane.restarts += 1
+                    lane.restart_at = 0.0
+                    start(lane, ctx, stats_queue)
+
+            if now >= next_report:
+                next_report = now + report_every
+                parts = [f"lane{lane.lane} {lane.fps:5.1f} FPS ({lane.phase}, {lane.restarts} restarts)"
+                         for lane in lanes]
+                print(f"Total {sum(lane.fps for lane in lanes):5.1f} FPS | " + " | ".join(parts))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for lane in lanes:
+            if lane.process.is_alive():
+                lane.process.terminate()
+        for lane in lanes:
+            lane.process.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one push-up counter process per camera.")
+    parser.add_argument("--lane", action="append", required=True, metavar="CAMERA[:CORE]",
+                        help="Camera index for a lane, optionally pinned to a CPU core (repeat per lane)")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between FPS reports")
+    parser.add_argument("--headless", action="store_true", help="Run every lane without a window")
+    parser.add_argument("--preview-port", type=int, metavar="PORT",
+                        help="Serve each lane's MJPEG preview, lane N on PORT+N-1")
+    args = parser.parse_args()
+
+    lanes = parse_lanes(args.lane)
+    for lane in lanes:
+        if args.headless:
+            lane.extra_args.append("--headless")
+        if args.preview_port:
+            lane.extra_args += ["--preview-port", str(args.preview_port + lane.lane - 1)]
+    supervise(lanes, args.report_every)
+
+
+if __name__ == "__main__":
+    main()
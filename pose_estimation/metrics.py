@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+import numpy as np
+
+
+class RollingHistogram:
+    """Keeps the last N latency samples (ms) in a fixed ring buffer."""
+
+    __slots__ = ("samples", "index", "total")
+
+    def __init__(self, size=1024):
+        self.samples = np.zeros(size, np.float32)
+        self.index = 0
+        self.total = 0  # Samples ever added, used for rates
+
+    def add(self, ms):
+        self.samples[self.index] = ms
+        self.index = (self.index + 1) % len(self.samples)
+        self.total += 1
+
+    def percentiles(self):
+        """Returns (p50, p95, p99) over the samples currently held."""
+        n = min(self.total, len(self.samples))
+        if n == 0:
+            return 0.0, 0.0, 0.0
+        p50, p95, p99 = np.percentile(self.samples[:n], [50, 95, 99])
+        return float(p50), float(p95), float(p99)
+
+
+class StageTimer:
+    """Context manager that times one stage into its histogram. Each stage is timed by one thread."""
+
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist):
+        self.hist = hist
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.add((time.perf_counter() - self.start) * 1000.0)
+
+
+class NullTimer:
+    """Stands in for StageTimer when instrumentation is off, it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageMetrics:
+    """Per-stage latency histograms, published periodically over MQTT and to a local file.
+
+    Components fetch their timers once with timer(name) and wrap each stage in a `with` block.
+    When instrumentation is disabled they get NULL_TIMER instead, so the hot path only pays for
+    an empty context manager.
+    """
+
+    def __init__(self, publish=None, path=None, interval=10.0, window=1024):
+        """
+        Args:
+            publish: Optional callable(payload_str) used to send each report, e.g. over MQTT
+            path: Optional file that every report is appended to as one JSON line
+            interval: Seconds between reports
+            window: Samples kept per stage
+        """
+        self.publish = publish
+        self.path = path
+        self.interval = interval
+        self.window = window
+        self.timers = {}
+        self.last_totals = {}
+        self.last_report = time.time()
+        self.running = True
+        self.thread = threading.Thread(target=self.report_loop, name="metrics", daemon=True)
+        self.thread.start()
+
+    def timer(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = StageTimer(RollingHistogram(self.window))
+        return timer
+
+    def snapshot(self):
+        """Builds a report of p50/p95/p99 (ms) and rate (per second) for every stage."""
+        now = time.time()
+        elapsed = max(1e-6, now - self.last_report)
+        stages = {}
+        for name, timer in list(self.timers.items()):
+            hist = timer.hist
+            p50, p95, p99 = hist.percentiles()
+            rate = (hist.total - self.last_totals.get(name, 0)) / elapsed
+            self.last_totals[name] = hist.total
+            stages[name] = {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3),
+                            "rate": round(rate, 1)}
+        self.last_report = now
+        return {"timestamp": now, "stages": stages}
+
+    def report_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            report = json.dumps(self.snapshot())
+            if self.publish:
+                try:
+                    self.publish(report)
+                except Exception as e:
+                    print(f"Metrics publish error: {e}")
+            if self.path:
+                try:
+                    with open(self.path, "a") as f:
+                        f.write(report + "\n")
+                except OSError as e:
+                    print(f"Metrics file error: {e}")
+
+    def stop(self):
+        self.running = False
+
+
+def get_timer(metrics, name):
+    """Returns the named timer, or NULL_TIMER when metrics is None (instrumentation off)."""
+    return metrics.timer(name) if metrics is not None else NULL_TIMER
@@ -1,12 +1,44 @@
 import cv2
 import mediapipe as mp
-import math
+import numpy as np
+from metrics import NULL_TIMER
+
+NUM_LANDMARKS = 33  # MediaPipe Pose landmark count
+
+# Joint triplets (p1, joint, p3) used by the push-up counter
+ELBOW = (11, 13, 15)
+SHOULDER = (13, 11, 23)
+HIP = (11, 23, 25)
+PUSHUP_ANGLES = np.array([ELBOW, SHOULDER, HIP])
+
+def joint_angles(landmarks, triplets):
+    """Vectorised joint angles for a landmark array.
+    
+    Args:
+        landmarks: ... x N x 4 landmark array (x, y, z, visibility), e.g. one frame or a whole trace
+        triplets: K x 3 landmark ids, the middle one being the joint
+        
+    Returns:
+        ... x K array of angles in degrees
+    """
+    idx = np.asarray(triplets)
+    pts = landmarks[..., :2]
+    a, b, c = pts[..., idx[:, 0], :], pts[..., idx[:, 1], :], pts[..., idx[:, 2], :]
+    
+    #Calculate Angles
+    angles = np.degrees(np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0]) -
+                        np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    neg = angles < 0
+    angles[neg] += 360
+    flip = neg & (angles > 180)
+    angles[flip] = 360 - angles[flip]
+    return angles
 
 class poseDetector() :
     
     def __init__(self, mode=False, complexity=0, smooth_landmarks=False,
                 enable_segmentation=False, smooth_segmentation=False,
-                detectionCon=0.5, trackCon=0.5):
+                detectionCon=0.5, trackCon=0.5, roi_tracker=None):
         
         self.mode = mode 
         self.complexity = complexity
@@ -15,6 +47,7 @@ class poseDetector() :
         self.smooth_segmentation = smooth_segmentation
         self.detectionCon = detectionCon
         self.trackCon = trackCon
+        self.roi_tracker = roi_tracker  # Optional RoiTracker to crop the inference input
         
         self.mpDraw = mp.solutions.drawing_utils
         self.mpPose = mp.solutions.pose
@@ -22,58 +55,119 @@ class poseDetector() :
                                      self.enable_segmentation, self.smooth_segmentation,
                                      self.detectionCon, self.trackCon)
         
+        # x, y (pixels), z and visibility per landmark, reused across frames
+        self.landmarks = np.zeros((NUM_LANDMARKS, 4), np.float32)
+        self.lmList = self.landmarks[:0]
+        self.region = (0, 0, 0, 0)  # (x0, y0, w, h) of the frame the results refer to
+        
+        # Stage timers, replaced with real ones when instrumentation is on
+        self.t_convert = NULL_TIMER
+        self.t_pose = NULL_TIMER
+        
         
     def findPose (self, img, draw=True):
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        self.results = self.pose.process(imgRGB)
+        h, w = img.shape[:2]
+        if self.roi_tracker is None:
+            self.region = (0, 0, w, h)
+            self.results = self.process(img)
+        else:
+            used_roi = self.roi_tracker.roi is not None
+            crop, self.region = self.roi_tracker.crop(img)
+            self.results = self.process(crop)
+            
+            # Lost the person inside the ROI, retry on the full frame straight away
+            if used_roi and not self.results.pose_landmarks:
+                self.roi_tracker.reset()
+                crop, self.region = self.roi_tracker.crop(img)
+                self.results = self.process(crop)
         
-        if self.results.pose_landmarks and draw:
-           self.mpDraw.draw_landmarks(img,self.results.pose_landmarks, self.mpPose.POSE_CONNECTIONS)
+        if draw:
+            self.drawLandmarks(img)
                 
         return img
     
+    def process(self, img):
+        with self.t_convert:
+            imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        with self.t_pose:
+            return self.pose.process(imgRGB)
+    
     def findPosition(self, img, draw=True):
-        self.lmList = []
+        """Fills the preallocated landmark array with pixel x, y, z and visibility.
+
+        Returns a view of the rows that were filled (empty when no pose was found).
+        The array is reused, so the values are overwritten by the next frame.
+        """
+        self.lmList = self.landmarks[:0]
         if self.results.pose_landmarks:
+            x0, y0, w, h = self.region
+            lms = self.landmarks
+            n = 0
             for id, lm in enumerate(self.results.pose_landmarks.landmark):
-                # Only process landmarks with sufficient confidence
-                h, w, c = img.shape
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                self.lmList.append([id, cx, cy])
+                lms[id] = (lm.x, lm.y, lm.z, lm.visibility)
+                n += 1
+            # Normalised (crop) -> full-frame pixel coordinates (z uses the same scale as x)
+            lms[:n, 0] = lms[:n, 0] * w + x0
+            lms[:n, 1] = lms[:n, 1] * h + y0
+            lms[:n, 2] *= w
+            self.lmList = lms[:n]
+        if self.roi_tracker is not None:
+            self.roi_tracker.update(self.lmList, img.shape)
         return self.lmList
         
+    def findAngles(self, triplets):
+        """Computes the joint angles for every (p1, p2, p3) triplet in one pass.
+
+        Args:
+            triplets: K x 3 landmark ids, p2 being the joint the angle is measured at
+
+        Returns:
+            Array of K angles in degrees
+        """
+        return joint_angles(self.landmarks, triplets)
         
     def findAngle(self, img, p1, p2, p3, draw=True):   
+        angle = float(self.findAngles(((p1, p2, p3),))[0])
+        if draw:
+            self.drawAngle(img, p1, p2, p3, angle)
+        return angle
+        
+    def drawLandmarks(self, img):
+        if not self.results.pose_landmarks:
+            return img
+        if self.roi_tracker is None:
+            self.mpDraw.draw_landmarks(img, self.results.pose_landmarks, self.mpPose.POSE_CONNECTIONS)
+            return img
+        
+        # Results are relative to the ROI crop, so map them back before drawing
+        x0, y0, w, h = self.region
+        pts = [(int(lm.x * w + x0), int(lm.y * h + y0)) for lm in self.results.pose_landmarks.landmark]
+        for a, b in self.mpPose.POSE_CONNECTIONS:
+            cv2.line(img, pts[a], pts[b], (255,255,255), 2)
+        for pt in pts:
+            cv2.circle(img, pt, 3, (0,0,255), cv2.FILLED)
+        return img
+        
+    def drawAngle(self, img, p1, p2, p3, angle):
         #Get the landmarks
-        x1, y1 = self.lmList[p1][1:]
-        x2, y2 = self.lmList[p2][1:]
-        x3, y3 = self.lmList[p3][1:]
-        
-        #Calculate Angle
-        angle = math.degrees(math.atan2(y3-y2, x3-x2) - 
-                             math.atan2(y1-y2, x1-x2))
-        if angle < 0:
-            angle += 360
-            if angle > 180:
-                angle = 360 - angle
-        # print(angle)
+        x1, y1 = map(int, self.landmarks[p1, :2])
+        x2, y2 = map(int, self.landmarks[p2, :2])
+        x3, y3 = map(int, self.landmarks[p3, :2])
         
         #Draw
-        if draw:
-            cv2.line(img, (x1, y1), (x2, y2), (255,255,255), 3)
-            cv2.line(img, (x3, y3), (x2, y2), (255,255,255), 3)
+        cv2.line(img, (x1, y1), (x2, y2), (255,255,255), 3)
+        cv2.line(img, (x3, y3), (x2, y2), (255,255,255), 3)
 
-            
-            cv2.circle(img, (x1, y1), 5, (0,0,255), cv2.FILLED)
-            cv2.circle(img, (x1, y1), 15, (0,0,255), 2)
-            cv2.circle(img, (x2, y2), 5, (0,0,255), cv2.FILLED)
-            cv2.circle(img, (x2, y2), 15, (0,0,255), 2)
-            cv2.circle(img, (x3, y3), 5, (0,0,255), cv2.FILLED)
-            cv2.circle(img, (x3, y3), 15, (0,0,255), 2)
-            
-            cv2.putText(img, str(int(angle)), (x2-50, y2+50), 
-                        cv2.FONT_HERSHEY_PLAIN, 2, (0,0,255), 2)
-        return angle
+        cv2.circle(img, (x1, y1), 5, (0,0,255), cv2.FILLED)
+        cv2.circle(img, (x1, y1), 15, (0,0,255), 2)
+        cv2.circle(img, (x2, y2), 5, (0,0,255), cv2.FILLED)
+        cv2.circle(img, (x2, y2), 15, (0,0,255), 2)
+        cv2.circle(img, (x3, y3), 5, (0,0,255), cv2.FILLED)
+        cv2.circle(img, (x3, y3), 15, (0,0,255), 2)
+        
+        cv2.putText(img, str(int(angle)), (x2-50, y2+50), 
+                    cv2.FONT_HERSHEY_PLAIN, 2, (0,0,255), 2)
+        return img
         
         
 def main():
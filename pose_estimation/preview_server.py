@@ -0,0 +1,143 @@
+import threading
+import time
+import cv2
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOUNDARY = "frame"
+
+PAGE = """<html><head><title>{title}</title></head>
+<body style="margin:0;background:#000"><img src="/stream" style="max-width:100%;max-height:100vh"></body></html>
+"""
+
+
+class PreviewServer:
+    """Serves the annotated frames as an MJPEG stream for a browser on the same network.
+
+    The frame loop calls publish() with every frame it would have displayed. That only keeps a
+    reference to the frame, and only when a viewer is connected and the rate cap allows it, so an
+    unwatched station pays nothing. JPEG encoding happens on the server's own thread, once per
+    frame no matter how many viewers there are.
+    """
+
+    def __init__(self, port=8080, max_fps=5.0, quality=70, width=480, title="Pushup Counter"):
+        """
+        Args:
+            port: HTTP port to listen on (all interfaces)
+            max_fps: Most frames per second sent to viewers
+            quality: JPEG quality of the stream
+            width: Frames are scaled down to this width before encoding (None keeps the size)
+            title: Page title
+        """
+        self.interval = 1.0 / max_fps
+        self.quality = quality
+        self.width = width
+        self.title = title
+        self.viewers = 0
+        self.next_frame_at = 0.0
+        self.pending = None   # Newest raw frame waiting to be encoded
+        self.jpeg = None      # Newest encoded frame
+        self.sequence = 0     # Bumped for every encoded frame
+        self.cond = threading.Condition()
+        self.running = True
+
+        self.httpd = ThreadingHTTPServer(("", port), self.make_handler())
+        self.httpd.daemon_threads = True
+        self.threads = [
+            threading.Thread(target=self.httpd.serve_forever, name="preview-http", daemon=True),
+            threading.Thread(target=self.encode_loop, name="preview-encode", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        print(f"Preview stream on http://0.0.0.0:{port}/")
+
+    def publish(self, img):
+        """Offers a frame to the stream, a no-op when nobody is watching or the rate cap is hit."""
+        if self.viewers == 0:
+            return
+        now = time.time()
+        if now < self.next_frame_at:
+            return
+        self.next_frame_at = now + self.interval
+        with self.cond:
+            self.pending = img  # Frames aren't modified after the pipeline hands them over, no copy needed
+            self.cond.notify_all()
+
+    def encode_loop(self):
+        while self.running:
+            with self.cond:
+                while self.running and self.pending is None:
+                    self.cond.wait(timeout=1.0)
+                img, self.pending = self.pending, None
+            if img is None:
+                continue
+
+            if self.width and img.shape[1] > self.width:
+                height = int(img.shape[0] * self.width / img.shape[1])
+                img = cv2.resize(img, (self.width, height), interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            with self.cond:
+                self.jpeg = buf.tobytes()
+                self.sequence += 1
+                self.cond.notify_all()
+
+    def wait_frame(self, last_sequence, timeout=5.0):
+        """Blocks until a frame newer than last_sequence is encoded, returns (sequence, jpeg)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.sequence != last_sequence or not self.running, timeout)
+            return self.sequence, self.jpeg
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/":
+                    body = PAGE.format(title=server.title).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path == "/stream":
+                    self.stream()
+                else:
+                    self.send_error(404)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+
+                with server.cond:
+                    server.viewers += 1
+                sequence = server.sequence
+                try:
+                    while server.running:
+                        new_sequence, jpeg = server.wait_frame(sequence)
+                        if new_sequence == sequence or jpeg is None:
+                            continue  # Nothing new (e.g. station idle), keep the connection open
+                        sequence = new_sequence
+                        self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Viewer closed the page
+                finally:
+                    with server.cond:
+                        server.viewers -= 1
+
+            def log_message(self, format, *args):
+                pass  # Keep request logs out of the counter's output
+
+        return Handler
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -2,104 +2,86 @@ import cv2
 import numpy as np
 import mediapipe as mp
 import pose_estimation as pm
+from frame_pipeline import FramePipeline
+from roi_tracker import RoiTracker
+import frame_scheduler as fs
 import time
 import paho.mqtt.client as mqtt
 from firestore_manager import FirestoreManager
 import os
 import json
-import pygame
-import subprocess
+import argparse
+import audio_feedback as af
+from snapshot_writer import SnapshotWriter
+from session_store import SessionStore
+from landmark_trace import TraceWriter
+import pushup_session as ps
+import pushup_protocol as proto
+from metrics import StageMetrics, NULL_TIMER, get_timer
+from preview_server import PreviewServer
 
 # Global variables
-count = 0                  # Number of successful pushups
-direction = 0              # 0: going down, 1: going up
-attempt_count = 0          # Number of total attempts
-bad_form_images = []       # List to store paths of saved bad form images
-current_attempt_saved = False  # Track if we've saved a bad form image for the current attempt
-counting = False           # Whether we're in counting mode
-ready_hold_time = None     # Time when ready position was first detected
-last_status = None         # Last user status
-timer_started = False      # Whether the session timer has started
-timer_start_time = None    # When the timer started
+session = ps.PushupSession()  # State of the current push-up session
 mqtt_client = None         # MQTT client
+publisher = None           # Sends protocol messages on mqtt_client
+receiver = proto.Receiver()  # Drops duplicated ranger messages
 firestore_mgr = None       # Firestore manager
-abnormal = False
-bad_form_detected = False
-at_top = False
-at_bottom = False
+store = None               # Local session database, synced to firestore_mgr in the background
+audio = None               # Background audio feedback engine
+snapshots = None           # Background bad form snapshot encoder
+recorder = None            # Landmark trace writer when recording
+topic_prefix = ""          # MQTT topic namespace, e.g. "lane2/" in multi-lane mode
+bad_form_dir = "bad_form"  # Where bad form snapshots are written
+session_serial = 0         # Sessions ended so far, keeps snapshot duplicate checks per session
+metrics = None             # StageMetrics when instrumentation is on
+tracing = False            # Publish per-hop latency records for messages to the Grove Pi
+
+# Stage timers, replaced with real ones when instrumentation is on
+t_state = t_snapshot = t_audio = t_display = NULL_TIMER
 
 # Add this function to handle incoming messages
 def on_message(client, userdata, message):
-    global abnormal, current_attempt_saved, bad_form_detected, at_top, at_bottom, attempt_count, direction
+    topic = message.topic[len(topic_prefix):]
+    msg = proto.decode(message.payload)
     
-    topic = message.topic
-    payload = message.payload.decode("utf-8")
-    
-    if topic == "pushup/badposture":
-        # Convert the payload to a boolean
-        if payload == "Bad posture":
-            abnormal = True
-            bad_form_detected = True
-            print(f"Received abnormal posture alert: {abnormal} current direction: {direction}")
-
-        if payload == "Attempt counted":
-            attempt_count += 1
-            at_top = True
-            print(f"Current attempt saved alert")
-            print(f"Attempt Number: {attempt_count}")
-            
-        if payload == "Bottom reached":
-            at_bottom = True
-
-def setup_mqtt():
+    if topic == proto.RANGER_TOPIC and receiver.accept(topic, msg):
+        if recorder:
+            recorder.add_event(msg.kind)
+        # Applied by the frame loop on the next step, so the session is only touched from one thread
+        session.post_event(msg.kind)
+        print(f"Received ranger event: {msg.kind}")
+
+def setup_mqtt(client_id="PushupCounter"):
     """Initializes and returns an MQTT client."""
-    global mqtt_client
-    broker_address = "172.20.10.4"
-    client = mqtt.Client("PushupCounter") # Create client with ID "PushupCounter"
+    global mqtt_client, publisher
+    client = mqtt.Client(client_id) # Client IDs must be unique per lane
 
     client.on_message = on_message
     
     try:
-        client.connect(broker_address, 1883) # Connect to broker on standard port
-        client.subscribe("pushup/badposture", qos=2)
+        client.connect(proto.BROKER, proto.PORT) # Connect to broker on standard port
+        client.subscribe(topic_prefix + proto.RANGER_TOPIC, qos=proto.SUBSCRIBE_QOS)
         client.loop_start() # Start background thread to handle network traffic
         mqtt_client = client
+        publisher = proto.Publisher(client, topic_prefix)
         return True
     except Exception as e:
         print(f"MQTT connection error: {e}")
         return False
 
-def setup_camera():
+def setup_camera(index=0):
     """Initializes the video capture object."""
-    cap = cv2.VideoCapture(0)
+    cap = cv2.VideoCapture(index)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 720)  # Keep resolution balanced for speed
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
     cap.set(cv2.CAP_PROP_FPS, 30)  # Request 30 FPS (Mediapipe will process as fast as possible)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Don't let the driver queue up stale frames
     return cap 
     
-def detect_form_issues(elbow, shoulder, hip):
-    """Detect specific form issues and returns the issue description if found."""
-    error = "Unknown Error"
-
-    if elbow > 90 and elbow < 145:
-        error = "Elbow angle incorrect"
-    elif hip < 145:
-        error = "Hip angle incorrect - back not straight"
-    elif (elbow > 90 and elbow < 145) and hip < 145:
-        error = "Hip and Elbow error"
-
-    return error
-
-#Function to play Audio Recording
-def play_sound(file_name):
-    # Initialize the mixer module if not already done
-    if not pygame.mixer.get_init():
-        pygame.mixer.init()
-    try:
-        pygame.mixer.music.load(f"{file_name}.mp3")  # use .wav if preferred
-        pygame.mixer.music.play()
-    except Exception as e:
-        print(f"Error playing sound: {e}")
+#Function to queue spoken feedback without blocking the frame loop
+def speak(text, priority=af.NORMAL):
+    if audio:
+        audio.say(text, priority)
 
     
 def save_bad_form(img, issue_type, attempt_num):
@@ -108,122 +90,32 @@ def save_bad_form(img, issue_type, attempt_num):
     if issue_type is not None:
 
         # Create directory if it doesn't exist
-        os.makedirs("bad_form", exist_ok=True)
+        os.makedirs(bad_form_dir, exist_ok=True)
         
         # Generate unique filename with timestamp
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"bad_form/attempt_{attempt_num + 1}_{issue_type}_{timestamp}.jpg"
+        filename = f"{bad_form_dir}/attempt_{attempt_num + 1}_{issue_type}_{timestamp}.jpg"
         
-        # Save the image
-        cv2.imwrite(filename, img)
+        # Copy the frame and let a worker encode it, only write inline if there is no worker
+        if snapshots:
+            # Only the same fault in the same attempt is a duplicate, a second fault keeps its image
+            if not snapshots.submit(img, filename, group=(session_serial, attempt_num, issue_type)):
+                return None  # Queue full, the snapshot was dropped
+        else:
+            cv2.imwrite(filename, img)
         print(f"Saved bad form image: {filename}")
-
-        bad_form_images.append(filename)
         
         return filename
     
-    
-def update_count(elbow, shoulder, hip, img):
-    """Determines the feedback message and updates the count based on the angles.
-    Also detects form issues and uploads to Firestore if necessary."""
-    global count, direction, attempt_count, timer_started
-    global timer_start_time, bad_form_images, current_attempt_saved, mqtt_client
-    global abnormal, current_attempt_saved, bad_form_detected, at_top, at_bottom
-
-    current_time = time.time()
-
-    if (hip < 145 or hip > 185) and current_attempt_saved == False:
-        print(f"HIP error")
-        subprocess.call(['espeak', 'Straighten Back'])
-        current_attempt_saved = True
-        form_issue = "Back error"
-        save_bad_form(img, form_issue, attempt_count)
-        bad_form_detected = True
-
-    #Check going DOWN
-    if direction == 0:
-        
-        #Start timer
-        if not timer_started and mqtt_client and elbow <= 90:
-            timer_started = True
-            timer_start_time = current_time
-            direction = 1
-            mqtt_client.publish("pushup/status", "Start", qos=2)
-            mqtt_client.publish("pushup/direction", "up", qos=2)
-            print("Timer started! 60 seconds countdown begins.")
-            
-        #User reach bottom and elbow <= 90
-        if timer_started and at_bottom == True and elbow <= 90:
-            direction = 1
-            mqtt_client.publish("pushup/direction", "up", qos=2)
-            at_bottom = False
-            
-        #User start going up before reach bottom and elbow <= 90
-        if abnormal:
-            print(f"DOWN Abnormal: {abnormal}")
-            abnormal = False
-            direction = 1
-            bad_form_detected = True
-            mqtt_client.publish("pushup/direction", "up", qos=2) #Set direction to UP
-            
-            if current_attempt_saved == False:
-                current_attempt_saved = True
-                form_issue = detect_form_issues(elbow, shoulder, hip)
-                save_bad_form(img, form_issue, attempt_count)
-            
-        return
 
-    #Check going UP
-    if direction == 1:
-        #print(f"In UP Block abnormal posture: {abnormal}, current direction: {direction}, bad form detected: {bad_form_detected}")
-        
-        if at_top == True:
-            
-            print(f"Elbow: {elbow} and bad form detected: {bad_form_detected}")
-            
-            #Bad form detected during attempt
-            if bad_form_detected:
-                subprocess.call(['espeak', 'No Count'])
-                print(f"No Count")
-                direction = 0
-                at_top = False
-                current_attempt_saved = False
-                bad_form_detected = False
-                mqtt_client.publish("pushup/direction", "down", qos=2)
-                return   
-            
-            #Reached Top with elbow > 145 and Proper form
-            if elbow > 145 and not bad_form_detected:
-                count += 1
-                subprocess.call(['espeak', str(count)])
-                mqtt_client.publish("pushup/direction", "down", qos=2)
-                mqtt_client.publish("pushup/status", "Push up counted", qos=2)
-                print(f"Count: {count}")
-                direction = 0
-                at_top = False
-                current_attempt_saved = False
-                bad_form_detected = False
-                
-                return    
-
-        #Go down before reaching top and elbow < 145
-        if abnormal:
-            print(f"UP Abnormal: {abnormal}")
-            direction = 0
-            at_top = False
-            current_attempt_saved = False
-            bad_form_detected = False
-            subprocess.call(['espeak', 'No Count'])
-            print(f"No Count")
-            mqtt_client.publish("pushup/direction", "down", qos=2)
-            abnormal = False
-            if current_attempt_saved == False:
-                #current_attempt_saved = True
-                form_issue = detect_form_issues(elbow, shoulder, hip)
-                save_bad_form(img, form_issue, attempt_count)
-            
-            return
-        
+def collect_images(image_paths):
+    """Waits for pending snapshots and returns their encoded upload images (duplicates left out)."""
+    if not snapshots:
+        return None
+    snapshots.flush()
+    return snapshots.take_images(image_paths)
+    
+    
 def check_valid_pose(lmList):
     """Checks if a valid person pose is detected."""
     valid_pose = False
@@ -234,218 +126,205 @@ def check_valid_pose(lmList):
     return valid_pose
 
 
-def check_ready_position(elbow, shoulder, hip):
-    """Checks if person is in the UP position and ready to start counting."""
-    global ready_hold_time, counting, mqtt_client, attempt_count
-
-    in_up_position = (elbow > 145 and shoulder > 40 and hip > 145)
-        
-    if in_up_position:
-        # Start or continue the ready timer
-        if ready_hold_time is None:
-            ready_hold_time = time.time()
-
-        # If held for 1.5 seconds, start counting
-        elif time.time() - ready_hold_time > 1.5 and not counting:
-            print("You may start!")
-            subprocess.call(['espeak', 'You May Start'])
-            # Publish MQTT message when user is in position
-            if mqtt_client:
-                mqtt_client.publish("pushup/status", "User in position", qos=2)
-                print("Published: User in position")
-
-            counting = True
-            return True  # Return ready_hold_time, counting=True
-    else:
-        ready_hold_time = None
-        print("Get in UP Position")
-    
-    return False
-    
-#Check if user exist
-def check_user(lmList):
-    """Checks if a valid person pose is detected."""
-    global last_status, mqtt_client, timer_started, timer_start_time, counting, count, direction, bad_form_images, attempt_count, ready_hold_time, current_attempt_saved, at_top, bad_form_detected, abnormal
-
-    valid_user = False
-    if len(lmList) >= 25:  # Make sure we have enough landmarks
-        key_points = [11, 13, 15, 23, 25]  # Shoulder, elbow, wrist, hip, knee
-        if all(point < len(lmList) for point in key_points):
-            valid_user = True   
-
-    # Track status change
-    current_status = "User detected" if valid_user else "No user detected"
-    status_changed = (last_status is None or current_status != last_status)
-
-    # Only publish when status actually changes
-    if mqtt_client and status_changed:
-        # Clear any queued messages by sending with higher QoS
-        mqtt_client.publish("pushup/status", current_status, qos=2)
-        print(f"Status CHANGED to: {current_status}")
-
-    if not valid_user:
-        
-        mqtt_client.publish("pushup/status", "End", qos=2)
-        
-        #Send to firebase
-        if bad_form_images:
-            session_stats = {
-                "timestamp": time.time(),
-                "total_pushups": count,
-                "total_attempts": attempt_count,
-                "success_rate": (count / max(1, attempt_count)) * 100,
-                "session_duration": 60  # seconds
-            }    
-            
-            upload_results = firestore_mgr.send_to_firebase(
-                bad_form_images=bad_form_images,
-                session_stats=session_stats
-            )
-            print(f"Upload results: {upload_results['images_uploaded']} images uploaded")
-        
-        # Reset timer and session variables
-        timer_started = False
-        timer_start_time = None
-        counting = False
-        count = 0
-        attempt_count = 0
-        direction = 0
-        bad_form_images = []
-        ready_hold_time = None
-        current_attempt_saved = False
-        at_top = False
-        bad_form_detected = False
-        abnormal = False
-
-    last_status = current_status
-    return valid_user
-    
-    
-def check_60s(current_time):
-    """Check if 60 seconds have elapsed and handle session end if needed."""
-    global timer_started, timer_start_time, bad_form_images, count, attempt_count
-    global ready_hold_time, current_attempt_saved, mqtt_client, counting, direction
-    global firestore_mgr
-
-    if timer_started:
-        elapsed_time = current_time - timer_start_time
-        remaining_time = max(0, 60 - elapsed_time)
-        #print(f"Remaining time: {remaining_time}")
-
-        if remaining_time <= 0:
-            subprocess.call(['espeak', 'Times Up'])
-            mqtt_client.publish("pushup/status", "End", qos=2)
-            
-            # Prepare session stats
-            session_stats = {
-                "timestamp": time.time(),
-                "total_pushups": count,
-                "total_attempts": attempt_count,
-                "success_rate": (count / max(1, attempt_count)) * 100,
-                "session_duration": 60  # seconds
-            }    
-
-            # Send bad form images to Firebase
-            if bad_form_images:
-                upload_results = firestore_mgr.send_to_firebase(
-                    bad_form_images=bad_form_images,
-                    session_stats=session_stats
-                )
-                print(f"Upload results: {upload_results['images_uploaded']} images uploaded")
-
-            # Reset timer and session variables
-            timer_started = False
-            timer_start_time = None
-            counting = False
-            count = 0
-            attempt_count = 0
-            direction = 0
-            bad_form_images = []
-            ready_hold_time = None
-            current_attempt_saved = False
-            at_top = False
-            bad_form_detected = False
-            abnormal = False
+def upload_session(session_stats, image_paths, session_id, telemetry=None):
+    """Stores a finished session, or uploads it directly if it has bad form images and there is no store."""
+    if store:
+        # Written locally with its encoded snapshots and synced in the background,
+        # the next user can start straight away
+        store.end_session(session_stats, image_paths, session_id, telemetry, collect_images(image_paths))
+        print(f"Session stored ({len(image_paths)} images)")
+        return
+    if not image_paths or not firestore_mgr:
         return
+    images = collect_images(image_paths)
+    if images is not None:
+        image_paths = [path for path in image_paths if path in images]
+    upload_results = firestore_mgr.send_to_firebase(
+        bad_form_images=image_paths,
+        session_stats=session_stats,
+        thumbnails={path: image.thumbnail for path, image in (images or {}).items()},
+        full_images={path: image.full for path, image in (images or {}).items() if image.full},
+        session_id=session_id
+    )
+    print(f"Upload results: {upload_results['images_uploaded']} images uploaded")
+
+
+def publish_trace(trace_id, kind, frame_time, stepped_at):
+    """Publishes this Pi's hops for one message, the Grove Pi publishes the rest."""
+    trace = proto.HopTrace(trace_id, "pi5", kind)
+    trace.mark("capture", frame_time)  # Frame the decision was made on was read
+    trace.mark("counted", stepped_at)  # State machine decided to send it
+    trace.mark("published")
+    mqtt_client.publish(topic_prefix + proto.TRACE_TOPIC, trace.to_json(), qos=0)
+
+
+def run_actions(actions, img, frame_time=None, stepped_at=None):
+    """Carries out the MQTT publishes, speech, snapshots and uploads requested by the session."""
+    global session_serial
+    for action in actions:
+        kind = action[0]
+        if kind == ps.PUBLISH:
+            _, topic, kind = action
+            # QoS is picked per message kind, repeated direction hints are coalesced
+            trace_id = publisher.send(topic, kind) if publisher else None
+            if trace_id:
+                if tracing:
+                    publish_trace(trace_id, kind, frame_time, stepped_at)
+                print(f"Published {topic}: {kind}")
+        elif kind == ps.SPEAK:
+            _, text, urgent = action
+            with t_audio:
+                speak(text, af.HIGH if urgent else af.NORMAL)
+            print(text)
+        elif kind == ps.SNAPSHOT:
+            _, issue, attempt_num, image_list = action
+            with t_snapshot:
+                filename = save_bad_form(img, issue, attempt_num)
+            if filename:
+                image_list.append(filename)
+        elif kind == ps.ATTEMPT:
+            if store:
+                store.add_attempt(action[1])
+        elif kind == ps.END:
+            _, session_stats, image_list, session_id, telemetry = action
+            upload_session(session_stats, image_list, session_id, telemetry)
+            session_serial += 1
+
+
+def process_frame(lmList, angles, img, current_time):
+    """Runs the session state machine on one processed frame and returns the session phase."""
+    if not check_valid_pose(lmList):
+        angles = None
+
+    with t_state:
+        actions = session.step(angles, session.drain_events(), current_time)
+    if actions:
+        run_actions(actions, img, current_time, time.time()) # Frame is only copied if a snapshot is taken
+
+    if session.state == ps.SessionState.NO_USER:
+        return fs.IDLE
+    return fs.COUNTING if session.counting else fs.READY
         
         
-def calculate_fps(prev_time):
-    """Calculate frames per second."""
-    cur_time = time.time()
-    fps = 1 / (cur_time - prev_time)
-    print(f"FPS: {fps:.2f}")
-    return cur_time, fps
-    
-
-def main():
-    global count, direction, attempt_count, bad_form_images, current_attempt_saved
-    global counting, ready_hold_time, last_upload_time, last_status
-    global timer_started, timer_start_time, mqtt_client, firestore_mgr
-
-    # Initialize variables
-    count = 0
-    direction = 0
-    attempt_count = 0
-    bad_form_images = []
-    current_attempt_saved = False
-    counting = False
-    ready_hold_time = None
-    last_upload_time = None
-    last_status = None
-    timer_started = False
-    timer_start_time = None
-    abnormal = False
-    bad_form_detected = False
-    at_top = False
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Push-up counter (Pi 5 camera station)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="Append every processed frame's landmarks and ranger events to a trace file")
+    parser.add_argument("--camera", type=int, default=0, help="Video device index")
+    parser.add_argument("--lane", type=int,
+                        help="Lane number, gives this station its own MQTT topics, client ID and snapshot folder")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Time every stage and publish p50/p95/p99 on the metrics topic and to a file")
+    parser.add_argument("--metrics-file", help="File the metrics reports are appended to "
+                                               "(default metrics.jsonl, metrics_lane<N>.jsonl with --lane)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between metrics reports")
+    parser.add_argument("--trace", action="store_true",
+                        help="Publish per-hop latency records for messages to the Grove Pi (see trace_collector.py)")
+    parser.add_argument("--headless", action="store_true", help="No window, skip all GUI work")
+    parser.add_argument("--full-res", action="store_true",
+                        help="Also upload full resolution bad form images and keep them in the snapshot folder")
+    parser.add_argument("--preview-port", type=int, metavar="PORT",
+                        help="Serve the annotated frames as an MJPEG stream on this port")
+    parser.add_argument("--preview-fps", type=float, default=5.0, help="Frame rate cap of the preview stream")
+    return parser.parse_args(argv)
+
+
+def main(args, stats_queue=None):
+    """Runs one camera station. stats_queue, if given, receives (lane, fps, phase) once a second."""
+    global session, receiver, mqtt_client, firestore_mgr, store, audio, snapshots, recorder, topic_prefix, bad_form_dir
+    global metrics, tracing, t_state, t_snapshot, t_audio, t_display
+
+    session = ps.PushupSession()
+    receiver = proto.Receiver()
+    client_id = "PushupCounter"
+    if args.lane is not None:
+        topic_prefix = proto.lane_prefix(args.lane)
+        client_id = f"PushupCounter-lane{args.lane}"
+        bad_form_dir = os.path.join("bad_form", f"lane{args.lane}")
 
     #Setup
-    cap = setup_camera()
-    detector = pm.poseDetector()
-    setup_mqtt() #Set up mqtt
+    cap = setup_camera(args.camera)
+    detector = pm.poseDetector(roi_tracker=RoiTracker()) # Crop inference to the user once found
+    setup_mqtt(client_id) #Set up mqtt
     firestore_mgr = FirestoreManager(credential_path="firebase-credentials.json") # Initialize Firestore manager
+    suffix = "" if args.lane is None else f"_lane{args.lane}"
+    store = SessionStore(firestore_mgr, f"sessions{suffix}.db") # Syncs whenever the network is up
+    audio = af.AudioFeedback() # Pre-renders voice clips in the background
+    snapshots = SnapshotWriter(full_res=args.full_res) # Encodes bad form images off the frame loop
+    if args.record:
+        recorder = TraceWriter(args.record)
+        print(f"Recording landmark trace to {args.record}")
+
+    tracing = args.trace
+    if args.metrics:
+        def publish_metrics(report):
+            if mqtt_client:
+                mqtt_client.publish(topic_prefix + proto.METRICS_TOPIC, report, qos=0)
+        metrics_file = args.metrics_file or f"metrics{suffix}.jsonl" # One file per lane, like the session store
+        metrics = StageMetrics(publish_metrics, metrics_file, args.metrics_interval)
+        t_state = get_timer(metrics, "state")
+        t_snapshot = get_timer(metrics, "snapshot")
+        t_audio = get_timer(metrics, "audio")
+        t_display = get_timer(metrics, "display")
+
+    preview = None
+    if args.preview_port:
+        preview = PreviewServer(args.preview_port, args.preview_fps, title=f"Pushup Counter {topic_prefix}".strip())
 
     # Ensure bad_form directory exists
-    os.makedirs("bad_form", exist_ok=True)
+    os.makedirs(bad_form_dir, exist_ok=True)
 
-    prev_time = time.time()  # Initialize FPS timer
-    
-    while cap.isOpened():
-        ret, img = cap.read()
-        if not ret:
-            break
-
-        current_time = time.time()
-        img = detector.findPose(img, False)
-        lmList = detector.findPosition(img, False)
+    fps_frames, fps_start = 0, time.time()  # Throughput reported to the lane supervisor
 
-        valid_user = check_user(lmList) #Check if user exist
+    # Capture and inference run on their own threads, this loop is the state/feedback stage
+    scheduler = fs.FrameScheduler() # Low inference rate until a session is counting
+    pipeline = FramePipeline(cap, detector, valid_pose=check_valid_pose, scheduler=scheduler,
+                             recorder=recorder, metrics=metrics,
+                             draw=not args.headless or preview is not None) # Angles only drawn if someone can see them
+    pipeline.start()
 
-        if not valid_user:
+    while not pipeline.done():
+        packet = pipeline.get_result()
+        if packet is None:
             continue
 
-        # Get key angles
-        elbow = detector.findAngle(img, 11, 13, 15)
-        shoulder = detector.findAngle(img, 13, 11, 23)
-        hip = detector.findAngle(img, 11, 23, 25)
+        fps_frames += 1
+        if stats_queue is not None and packet.timestamp - fps_start >= 1.0:
+            try:
+                stats_queue.put_nowait((args.lane, fps_frames / (packet.timestamp - fps_start), scheduler.phase))
+            except Exception:
+                pass  # Supervisor is behind, skip this report
+            fps_frames, fps_start = 0, packet.timestamp
 
-        # Check if person is in UP position (starting position)
-        if valid_user and not counting:
-            position_ready = check_ready_position(elbow, shoulder, hip)
+        # Run the state machine on the freshest pose
+        phase = process_frame(packet.lmList, packet.angles, packet.img, packet.timestamp)
+        scheduler.set_phase(phase)
 
-        # If counting is active, perform pushup detection
-        if counting:
-            update_count(elbow, shoulder, hip, img.copy())
-            check_60s(current_time)
+        if preview:
+            preview.publish(packet.img) # Free unless a viewer is connected
+
+        if phase == fs.IDLE or args.headless:
+            continue
             
-        # FPS Calculation
-        #prev_time, fps = calculate_fps(prev_time)
-        
-        cv2.imshow('Pushup Counter', img)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        # Per-stage FPS is in the metrics reports (--metrics)
+        with t_display:
+            cv2.imshow(f"Pushup Counter {topic_prefix}".strip(), packet.img)
+            key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
             break
 
+    pipeline.stop()
+    audio.stop()
+    store.stop()
+    if metrics:
+        metrics.stop()
+    if preview:
+        preview.stop()
+    if recorder:
+        recorder.close()
     cap.release()
-    cv2.destroyAllWindows()
+    if not args.headless:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
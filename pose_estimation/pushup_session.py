@@ -0,0 +1,365 @@
+import enum
+import threading
+import uuid
+import pushup_protocol as proto
+from rep_telemetry import RepTelemetry
+from pushup_protocol import STATUS_TOPIC, DIRECTION_TOPIC
+
+SESSION_LENGTH = 60  # seconds
+
+# Actions returned by PushupSession.step, carried out by the caller
+PUBLISH = "publish"    # (PUBLISH, topic, kind) - kind is a pushup_protocol message kind
+SPEAK = "speak"        # (SPEAK, text, urgent)
+SNAPSHOT = "snapshot"  # (SNAPSHOT, issue, attempt_num, image_list) - save the frame, append its path
+END = "end"            # (END, session_stats, image_list, session_id, telemetry) - session over, store/upload it
+ATTEMPT = "attempt"    # (ATTEMPT, record) - an attempt finished, record is a dict (see attempt_record)
+
+
+class SessionState(enum.Enum):
+    NO_USER = 0     # Nobody in front of the camera
+    GET_READY = 1   # User found, waiting for a 1.5 s hold in the UP position
+    GOING_DOWN = 2  # Counting, waiting for the bottom of the rep (the timer starts on the first one)
+    GOING_UP = 3    # Counting, waiting for the top of the rep
+
+
+COUNTING_STATES = (SessionState.GOING_DOWN, SessionState.GOING_UP)
+
+
+class PresenceTracker:
+    """Debounces the per-frame "valid pose found" signal into user present/absent.
+
+    The state only flips once the opposite signal has held for `frames` consecutive frames and
+    for at least `seconds`, so a few frames of lost landmarks (lighting, an arm leaving the frame)
+    don't end the session. Both limits apply so the behaviour is the same at 2 FPS and at 30 FPS.
+    """
+
+    __slots__ = ("present", "present_frames", "present_seconds", "absent_frames", "absent_seconds",
+                 "streak", "streak_start")
+
+    def __init__(self, present_frames=2, present_seconds=0.0, absent_frames=5, absent_seconds=1.0):
+        self.present = False
+        self.present_frames = present_frames    # Frames with a pose needed to declare a user
+        self.present_seconds = present_seconds
+        self.absent_frames = absent_frames      # Frames without a pose needed to declare the user gone
+        self.absent_seconds = absent_seconds
+        self.streak = 0            # Consecutive frames disagreeing with the current state
+        self.streak_start = None   # Time of the first of those frames
+
+    def update(self, valid, t):
+        """Feeds one frame, returns True if the present/absent state changed on it."""
+        if valid == self.present:
+            self.streak = 0
+            return False
+
+        if self.streak == 0:
+            self.streak_start = t
+        self.streak += 1
+
+        if valid:
+            frames, seconds = self.present_frames, self.present_seconds
+        else:
+            frames, seconds = self.absent_frames, self.absent_seconds
+        if self.streak >= frames and t - self.streak_start >= seconds:
+            self.present = valid
+            self.streak = 0
+            return True
+        return False
+
+
+def detect_form_issues(elbow, shoulder, hip):
+    """Detect specific form issues and returns the issue description if found."""
+    error = "Unknown Error"
+
+    if elbow > 90 and elbow < 145:
+        error = "Elbow angle incorrect"
+    elif hip < 145:
+        error = "Hip angle incorrect - back not straight"
+    elif (elbow > 90 and elbow < 145) and hip < 145:
+        error = "Hip and Elbow error"
+
+    return error
+
+
+class PushupSession:
+    """State of one push-up station session.
+
+    step() is a pure transition: it takes the frame's angles, the ranger events received since
+    the last frame and the frame time, updates the session and returns the actions (MQTT
+    publishes, speech, snapshots, session end) for the caller to carry out. Nothing in here does
+    I/O, so it can be driven from replays as fast as the data can be read.
+
+    post_event() is the only method meant to be called from another thread (the MQTT callback).
+    """
+
+    __slots__ = ("state", "count", "attempt_count", "attempt_index", "ready_hold_time", "timer_start_time",
+                 "current_attempt_saved", "bad_form_detected", "abnormal", "at_top", "at_bottom",
+                 "bad_form_images", "session_id", "rep", "rep_issue", "telemetry", "last_status",
+                 "presence", "events", "lock")
+
+    def __init__(self, presence=None, telemetry=None):
+        self.lock = threading.Lock()
+        self.telemetry = telemetry or RepTelemetry()  # Buffers are reused by every session
+        self.events = []        # Ranger payloads waiting for the next step, guarded by lock
+        self.last_status = None  # Last user status published
+        self.presence = presence or PresenceTracker()
+        self.reset()
+
+    def reset(self):
+        """Starts a fresh session (the user presence state is kept)."""
+        self.state = SessionState.NO_USER
+        self.count = 0                      # Number of successful pushups
+        self.attempt_count = 0              # Number of total attempts
+        self.attempt_index = 0              # Attempts finished, counted or not; numbers the one in progress
+        self.ready_hold_time = None         # Time when ready position was first detected
+        self.timer_start_time = None        # When the timer started
+        self.current_attempt_saved = False  # Whether a bad form image was saved for this attempt
+        self.bad_form_detected = False
+        self.abnormal = False
+        self.at_top = False
+        self.at_bottom = False
+        self.bad_form_images = []           # Paths of saved bad form images
+        self.session_id = str(uuid.uuid4()) # ID the session is stored and uploaded under
+        self.telemetry.clear()
+        self.reset_rep()
+
+    def reset_rep(self):
+        """Clears the current attempt's angle extremes."""
+        self.rep = [None, 360.0, 360.0, 360.0, 0.0]  # Start time, min elbow, min shoulder, min hip, max hip
+        self.rep_issue = None                         # Last form issue saved for this attempt
+
+    @property
+    def counting(self):
+        return self.state in COUNTING_STATES
+
+    @property
+    def timer_started(self):
+        return self.timer_start_time is not None
+
+    @property
+    def direction(self):
+        """0: going down, 1: going up"""
+        return 1 if self.state == SessionState.GOING_UP else 0
+
+    def stats(self, t):
+        reps = self.telemetry.summarize()
+        timed = [rep for rep in reps if rep["counted"]] or reps
+        return {
+            "timestamp": t,
+            "total_pushups": self.count,
+            "total_attempts": self.attempt_count,
+            "success_rate": (self.count / max(1, self.attempt_count)) * 100,
+            "session_duration": round(min(t - self.timer_start_time, SESSION_LENGTH)) if self.timer_started else 0,  # seconds
+            "min_elbow": min((rep["min_elbow"] for rep in reps), default=None),  # Deepest rep
+            "avg_tempo": round(sum(rep["tempo"] for rep in timed) / len(timed), 2) if timed else None,
+            "time_under_tension": round(sum(rep["time_under_tension"] for rep in reps), 2),
+            "reps": reps
+        }
+
+    # Event ingestion (MQTT thread)
+    def post_event(self, payload):
+        with self.lock:
+            self.events.append(payload)
+
+    def drain_events(self):
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    # Transitions
+    def step(self, angles, events, t):
+        """Advances the session by one frame.
+
+        Args:
+            angles: (elbow, shoulder, hip) in degrees, or None when no valid pose was found
+            events: Ranger payloads received since the previous step
+            t: Frame time in seconds
+
+        Returns:
+            List of actions for the caller to carry out
+        """
+        out = []
+        for payload in events:
+            self.apply_event(payload, t)
+
+        if not self.check_user(angles is not None, t, out):
+            if self.presence.present and self.counting:
+                self.check_60s(t, out)  # The clock keeps running through landmark dropouts
+            return out
+
+        elbow, shoulder, hip = angles
+        if not self.counting:
+            self.check_ready_position(elbow, shoulder, hip, t, out)
+        if self.counting:
+            self.telemetry.add(t, elbow, shoulder, hip, self.state.value)
+            self.update_count(elbow, shoulder, hip, t, out)
+            self.check_60s(t, out)
+        return out
+
+    def apply_event(self, payload, t):
+        if self.counting and payload in proto.CODES:
+            self.telemetry.add_event(t, proto.CODES[payload])
+        if payload == proto.BAD_POSTURE:
+            self.abnormal = True
+            self.bad_form_detected = True
+        elif payload == proto.ATTEMPT_COUNTED:
+            self.attempt_count += 1
+            self.at_top = True
+        elif payload == proto.BOTTOM_REACHED:
+            self.at_bottom = True
+
+    def end_session(self, t, out):
+        out.append((END, self.stats(t), self.bad_form_images, self.session_id, self.telemetry.to_bytes()))
+        self.reset()
+
+    def check_user(self, valid_pose, t, out):
+        """Returns True when this frame should be used, i.e. the user is present and has a pose."""
+        changed = self.presence.update(valid_pose, t)
+        present = self.presence.present
+        current_status = proto.USER_DETECTED if present else proto.NO_USER
+
+        # Only publish when status actually changes
+        if current_status != self.last_status:
+            out.append((PUBLISH, STATUS_TOPIC, current_status))
+        self.last_status = current_status
+
+        if not present:
+            if changed:
+                # User has left, end the session once instead of on every empty frame
+                out.append((PUBLISH, STATUS_TOPIC, proto.END))
+                if self.timer_started or self.attempt_count > 0 or self.attempt_index > 0:
+                    self.end_session(t, out)
+                else:
+                    self.reset()  # Only walked past, nothing worth storing
+            return False
+
+        if not valid_pose:
+            return False  # Brief dropout, keep the session and wait for the landmarks to come back
+
+        if self.state == SessionState.NO_USER:
+            self.state = SessionState.GET_READY
+        return True
+
+    def check_ready_position(self, elbow, shoulder, hip, t, out):
+        in_up_position = (elbow > 145 and shoulder > 40 and hip > 145)
+
+        if not in_up_position:
+            self.ready_hold_time = None
+            return
+
+        # Start or continue the ready timer, if held for 1.5 seconds start counting
+        if self.ready_hold_time is None:
+            self.ready_hold_time = t
+        elif t - self.ready_hold_time > 1.5:
+            out.append((SPEAK, "You May Start", True))
+            out.append((PUBLISH, STATUS_TOPIC, proto.USER_IN_POSITION))
+            self.state = SessionState.GOING_DOWN
+
+    def save_bad_form(self, issue, out):
+        self.rep_issue = issue
+        out.append((SNAPSHOT, issue, self.attempt_index, self.bad_form_images))
+
+    def attempt_record(self, counted, t):
+        start, min_elbow, min_shoulder, min_hip, max_hip = self.rep
+        return {
+            "session_id": self.session_id,
+            "number": self.attempt_index + 1,  # Unique in the session, aborted attempts included
+            "counted": counted,
+            "issue": self.rep_issue,
+            "started": start,
+            "ended": t,
+            "min_elbow": min_elbow,
+            "min_shoulder": min_shoulder,
+            "min_hip": min_hip,
+            "max_hip": max_hip,
+        }
+
+    def update_count(self, elbow, shoulder, hip, t, out):
+        rep = self.rep
+        if rep[0] is None:
+            rep[0] = t
+        rep[1] = min(rep[1], elbow)
+        rep[2] = min(rep[2], shoulder)
+        rep[3] = min(rep[3], hip)
+        rep[4] = max(rep[4], hip)
+
+        if (hip < 145 or hip > 185) and not self.current_attempt_saved:
+            out.append((SPEAK, "Straighten Back", False))
+            self.current_attempt_saved = True
+            self.save_bad_form("Back error", out)
+            self.bad_form_detected = True
+
+        #Check going DOWN
+        if self.direction == 0:
+
+            #Start timer
+            if not self.timer_started and elbow <= 90:
+                self.timer_start_time = t
+                self.state = SessionState.GOING_UP
+                out.append((PUBLISH, STATUS_TOPIC, proto.START))
+                out.append((PUBLISH, DIRECTION_TOPIC, proto.UP))
+
+            #User reach bottom and elbow <= 90
+            if self.timer_started and self.at_bottom and elbow <= 90:
+                self.state = SessionState.GOING_UP
+                out.append((PUBLISH, DIRECTION_TOPIC, proto.UP))
+                self.at_bottom = False
+
+            #User start going up before reach bottom and elbow <= 90
+            if self.abnormal:
+                self.abnormal = False
+                self.state = SessionState.GOING_UP
+                self.bad_form_detected = True
+                out.append((PUBLISH, DIRECTION_TOPIC, proto.UP))
+
+                if not self.current_attempt_saved:
+                    self.current_attempt_saved = True
+                    self.save_bad_form(detect_form_issues(elbow, shoulder, hip), out)
+            return
+
+        #Check going UP
+        if self.at_top:
+
+            #Bad form detected during attempt
+            if self.bad_form_detected:
+                out.append((SPEAK, "No Count", False))
+                self.next_attempt(False, t, out)
+                out.append((PUBLISH, DIRECTION_TOPIC, proto.DOWN))
+                return
+
+            #Reached Top with elbow > 145 and Proper form
+            if elbow > 145:
+                self.count += 1
+                out.append((SPEAK, str(self.count), False))
+                out.append((PUBLISH, DIRECTION_TOPIC, proto.DOWN))
+                out.append((PUBLISH, STATUS_TOPIC, proto.PUSHUP_COUNTED))
+                self.next_attempt(True, t, out)
+                return
+
+        #Go down before reaching top and elbow < 145
+        if self.abnormal:
+            issue = detect_form_issues(elbow, shoulder, hip)
+            self.rep_issue = issue
+            attempt = self.attempt_index
+            self.next_attempt(False, t, out)
+            out.append((SPEAK, "No Count", False))
+            out.append((PUBLISH, DIRECTION_TOPIC, proto.DOWN))
+            self.abnormal = False
+            # Snapshot belongs to the attempt that just ended
+            out.append((SNAPSHOT, issue, attempt, self.bad_form_images))
+
+    def next_attempt(self, counted, t, out):
+        out.append((ATTEMPT, self.attempt_record(counted, t)))
+        self.attempt_index += 1
+        self.telemetry.end_rep(t, counted)
+        self.reset_rep()
+        self.state = SessionState.GOING_DOWN
+        self.at_top = False
+        self.current_attempt_saved = False
+        self.bad_form_detected = False
+
+    def check_60s(self, t, out):
+        """Check if 60 seconds have elapsed and end the session if so."""
+        if self.timer_started and t - self.timer_start_time >= SESSION_LENGTH:
+            out.append((SPEAK, "Times Up", True))
+            out.append((PUBLISH, STATUS_TOPIC, proto.END))
+            self.end_session(t, out)
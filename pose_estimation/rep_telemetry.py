@@ -0,0 +1,147 @@
+import struct
+import numpy as np
+
+MAGIC = b"PUTL"
+VERSION = 1
+HEADER = struct.Struct("<4sBIIId")  # magic, version, samples, events, reps, session start time
+
+COLUMNS = (("t", "<f4", "samples"), ("elbow", "<f4", "samples"), ("shoulder", "<f4", "samples"),
+           ("hip", "<f4", "samples"), ("phase", "u1", "samples"), ("rep", "<u2", "samples"),
+           ("event_t", "<f4", "events"), ("event_code", "u1", "events"),
+           ("rep_end", "<f4", "reps"), ("rep_counted", "u1", "reps"))
+
+TENSION_ELBOW = 145  # Elbow angle (deg) below which the arms are holding the body, as in the up check
+
+
+class RepTelemetry:
+    """Per-frame angle time-series of one session in preallocated ring buffers.
+
+    add() and add_event() only write into numpy arrays allocated once, so recording costs no
+    allocation per frame. When a session outlasts the buffers the oldest samples are overwritten.
+    summarize() and to_bytes() run once at the end of the session.
+
+    The binary form is columnar: a header followed by each column's raw little-endian array,
+    oldest sample first (see to_bytes / from_bytes), 19 bytes per frame.
+    """
+
+    def __init__(self, capacity=2048, event_capacity=256, rep_capacity=128):
+        """
+        Args:
+            capacity: Frames kept, 2048 covers a 60 s session at 30 FPS
+            event_capacity: Ranger events kept
+            rep_capacity: Finished reps kept
+        """
+        self.t = np.zeros(capacity, np.float32)  # Seconds since start
+        self.elbow = np.zeros(capacity, np.float32)
+        self.shoulder = np.zeros(capacity, np.float32)
+        self.hip = np.zeros(capacity, np.float32)
+        self.phase = np.zeros(capacity, np.uint8)  # SessionState value the frame was seen in
+        self.rep_of = np.zeros(capacity, np.uint16)  # Rep the frame belongs to
+        self.event_t = np.zeros(event_capacity, np.float32)
+        self.event_code = np.zeros(event_capacity, np.uint8)  # pushup_protocol wire code, as a byte
+        self.rep_end = np.zeros(rep_capacity, np.float32)
+        self.rep_counted = np.zeros(rep_capacity, np.uint8)
+        self.clear()
+
+    def clear(self):
+        self.start = None  # Time of the first sample
+        self.samples = 0   # Totals so far, the buffers hold the last capacity of them
+        self.events = 0
+        self.reps = 0
+
+    def relative(self, t):
+        if self.start is None:
+            self.start = t
+        return t - self.start
+
+    def add(self, t, elbow, shoulder, hip, phase):
+        i = self.samples % len(self.t)
+        self.t[i] = self.relative(t)
+        self.elbow[i] = elbow
+        self.shoulder[i] = shoulder
+        self.hip[i] = hip
+        self.phase[i] = phase
+        self.rep_of[i] = self.reps
+        self.samples += 1
+
+    def add_event(self, t, code):
+        i = self.events % len(self.event_t)
+        self.event_t[i] = self.relative(t)
+        self.event_code[i] = ord(code)
+        self.events += 1
+
+    def end_rep(self, t, counted):
+        """Closes the current rep, later samples belong to the next one."""
+        i = self.reps % len(self.rep_end)
+        self.rep_end[i] = self.relative(t)
+        self.rep_counted[i] = counted
+        self.reps += 1
+
+    @staticmethod
+    def ordered(column, total):
+        """The column's valid entries, oldest first."""
+        size = len(column)
+        if total <= size:
+            return column[:total]
+        split = total % size
+        return np.concatenate((column[split:], column[:split]))
+
+    def columns(self):
+        n, e, r = self.samples, self.events, self.reps
+        return {
+            "t": self.ordered(self.t, n),
+            "elbow": self.ordered(self.elbow, n),
+            "shoulder": self.ordered(self.shoulder, n),
+            "hip": self.ordered(self.hip, n),
+            "phase": self.ordered(self.phase, n),
+            "rep": self.ordered(self.rep_of, n),
+            "event_t": self.ordered(self.event_t, e),
+            "event_code": self.ordered(self.event_code, e),
+            "rep_end": self.ordered(self.rep_end, r),
+            "rep_counted": self.ordered(self.rep_counted, r),
+        }
+
+    def summarize(self):
+        """Per finished rep: depth (min elbow), tempo (seconds per rep), descent/ascent split and
+        time under tension (seconds with the elbow below TENSION_ELBOW)."""
+        cols = self.columns()
+        t, elbow, rep_of = cols["t"], cols["elbow"], cols["rep"]
+        first_rep = self.reps - len(cols["rep_end"])
+        reps = []
+        for k, (end, counted) in enumerate(zip(cols["rep_end"], cols["rep_counted"])):
+            mask = rep_of == first_rep + k
+            if not mask.any():
+                continue  # Overwritten, or ended on its first frame
+            times, angles = t[mask], elbow[mask]
+            bottom = int(np.argmin(angles))
+            # Each frame's angle holds until the next frame (or the end of the rep)
+            dt = np.diff(np.append(times, end))
+            reps.append({
+                "rep": first_rep + k + 1,
+                "counted": bool(counted),
+                "min_elbow": round(float(angles[bottom]), 1),
+                "tempo": round(float(end - times[0]), 2),
+                "descent": round(float(times[bottom] - times[0]), 2),
+                "ascent": round(float(end - times[bottom]), 2),
+                "time_under_tension": round(float(dt[angles < TENSION_ELBOW].sum()), 2),
+            })
+        return reps
+
+    def to_bytes(self):
+        cols = self.columns()
+        header = HEADER.pack(MAGIC, VERSION, len(cols["t"]), len(cols["event_t"]), len(cols["rep_end"]),
+                             self.start or 0.0)
+        return header + b"".join(cols[name].astype(dtype).tobytes() for name, dtype, _ in COLUMNS)
+
+
+def from_bytes(data):
+    """Decodes RepTelemetry.to_bytes output into (session start time, {column name: array})."""
+    magic, version, samples, events, reps, start = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a version 1 rep telemetry blob")
+    counts = {"samples": samples, "events": events, "reps": reps}
+    offset, columns = HEADER.size, {}
+    for name, dtype, count in COLUMNS:
+        columns[name] = np.frombuffer(data, dtype, counts[count], offset)
+        offset += columns[name].nbytes
+    return start, columns
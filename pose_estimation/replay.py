@@ -0,0 +1,286 @@
+"""Offline replay and benchmark runner for the push-up counter.
+
+Feeds a recorded video through poseDetector and the pushup_counter state machine with stub
+MQTT/Firestore sinks and a simulated ultrasonic ranger, then reports per-stage latency, FPS
+and the rep/attempt counts against optional ground truth.
+
+A landmark trace written with `pushup_counter.py --record` can be replayed instead of a video.
+It skips MediaPipe entirely and uses the ranger events recorded with the session, so it runs
+much faster than real time.
+
+Usage:
+    python replay.py session.mp4 --labels session.json
+    python replay.py session.trace --labels session.json
+
+Labels file (all keys optional):
+    {"pushups": 12, "attempts": 14, "events": [[23.4, "Bad posture"], ...]}
+where events are extra ranger payloads injected at the given video time (seconds).
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import cv2
+import numpy as np
+import pose_estimation as pm
+from roi_tracker import RoiTracker
+import landmark_trace as lt
+import pushup_counter as pc
+import pushup_session as ps
+import pushup_protocol as proto
+from snapshot_writer import EncodedImage
+
+
+class FakeMessage:
+    """Just enough of paho's MQTTMessage for pushup_counter.on_message."""
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode("utf-8")
+
+
+class StubMqtt:
+    """Records publishes instead of sending them and forwards them to the simulated ranger."""
+
+    def __init__(self):
+        self.published = []  # (topic, message kind, qos)
+        self.ranger = None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        kind = proto.decode(payload).kind
+        self.published.append((topic, kind, qos))
+        if self.ranger is not None:
+            self.ranger.on_publish(topic, kind)
+
+    def count(self, kind):
+        return sum(1 for _, k, _ in self.published if k == kind)
+
+
+class StubFirestore:
+    """Keeps session uploads in memory."""
+
+    def __init__(self):
+        self.sessions = []
+
+    def send_to_firebase(self, bad_form_images, session_stats=None, user_id="testing", thumbnails=None,
+                         session_id=None, timestamp=None, full_images=None):
+        self.sessions.append({"images": list(bad_form_images), "stats": session_stats})
+        return {"success": True, "images_uploaded": len(bad_form_images), "failed_uploads": 0,
+                "image_doc_ids": [], "session_id": None}
+
+
+class StubSnapshots:
+    """Takes the frame copy a real snapshot costs but skips encoding and disk writes."""
+
+    def __init__(self):
+        self.taken = 0
+        self.paths = set()
+
+    def submit(self, img, path, group=None):
+        img.copy()
+        self.taken += 1
+        self.paths.add(path)
+        return True
+
+    def flush(self):
+        pass
+
+    def take_images(self, paths):
+        return {path: EncodedImage(b"", None, 0) for path in paths if path in self.paths}
+
+
+class SimulatedRanger:
+    """Stands in for the Pi 3 ultrasonic ranger.
+
+    Follows the direction hints the counter publishes and uses the elbow angle as a stand-in for
+    chest distance: "Bottom reached" once the elbow bends past 90 on the way down, and
+    "Attempt counted" once the arm straightens past 145 on the way up. Labelled events are
+    injected on top at their timestamps.
+    """
+
+    def __init__(self, events=(), simulate=True):
+        self.simulate = simulate  # False when replaying a trace that carries the real ranger events
+        self.direction = None
+        self.reached_top = False
+        self.bottom_sent = False
+        self.events = sorted(events)
+        self.received = []  # (t, payload) delivered to the counter
+
+    def on_publish(self, topic, kind):
+        if topic == proto.DIRECTION_TOPIC:
+            self.direction = kind
+            if kind == proto.DOWN:
+                self.reached_top = False
+                self.bottom_sent = False
+        elif kind == proto.END:
+            self.direction = None
+
+    def step(self, t, elbow):
+        """Delivers whatever the ranger would have sent by video time t."""
+        while self.events and self.events[0][0] <= t:
+            self.deliver(t, self.events.pop(0)[1])
+
+        if elbow is None or not self.simulate:
+            return
+        if self.direction == proto.DOWN and not self.bottom_sent and elbow <= 90:
+            self.bottom_sent = True
+            self.deliver(t, proto.BOTTOM_REACHED)
+        elif self.direction == proto.UP and not self.reached_top and elbow > 145:
+            self.reached_top = True
+            self.deliver(t, proto.ATTEMPT_COUNTED)
+
+    def deliver(self, t, payload):
+        self.received.append((t, payload))
+        pc.on_message(None, None, FakeMessage(proto.RANGER_TOPIC, payload))
+
+
+class StageTimes:
+    """Per-stage latency samples in milliseconds."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds * 1000.0)
+
+    def report(self):
+        lines = [f"{'stage':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+        for stage, values in self.samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            lines.append(f"{stage:<10} {p50:8.2f} {p95:8.2f} {p99:8.2f} {max(values):8.2f}")
+        return "\n".join(lines)
+
+
+def is_trace(path):
+    with open(path, "rb") as f:
+        return f.read(len(lt.MAGIC)) == lt.MAGIC
+
+
+def iter_trace(path):
+    """Yields (frame time, landmarks, recorded ranger payloads) for every frame in a trace."""
+    return lt.TraceReader(path).frames()
+
+
+def iter_video(path):
+    """Yields (video time, frame) for every frame in a video file."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            ret, img = cap.read()
+            if not ret:
+                break
+            yield index / fps, img
+            index += 1
+    finally:
+        cap.release()
+
+
+def run(path, labels=None, use_roi=True, verbose=False):
+    """Replays a video or landmark trace through the counter and returns a results dict."""
+    labels = labels or {}
+    trace = is_trace(path)
+    mqtt = StubMqtt()
+    ranger = SimulatedRanger(labels.get("events", []), simulate=not trace)
+    mqtt.ranger = ranger
+
+    pc.session = ps.PushupSession()
+    pc.mqtt_client = mqtt
+    pc.publisher = proto.Publisher(mqtt)
+    pc.receiver = proto.Receiver()
+    pc.firestore_mgr = StubFirestore()
+    pc.snapshots = StubSnapshots()
+    pc.audio = None
+
+    detector = None if trace else pm.poseDetector(roi_tracker=RoiTracker() if use_roi else None)
+    blank = np.zeros((720, 720, 3), np.uint8)  # Stand-in frame for snapshots during trace replays
+    times = StageTimes()
+    log = sys.stdout if verbose else io.StringIO()  # The counter prints a lot, keep it out of timings
+    frames = 0
+
+    start = time.perf_counter()
+    source = iter_trace(path) if trace else iter_video(path)
+    while True:
+        t0 = time.perf_counter()
+        item = next(source, None)
+        if item is None:
+            break
+        t1 = time.perf_counter()
+
+        if trace:
+            t, lmList, payloads = item
+            img = blank
+        else:
+            t, img = item
+            img = detector.findPose(img, False)
+            lmList = detector.findPosition(img, False)
+            payloads = ()
+        t2 = time.perf_counter()
+
+        angles = pm.joint_angles(lmList, pm.PUSHUP_ANGLES) if pc.check_valid_pose(lmList) else None
+        t3 = time.perf_counter()
+
+        with contextlib.redirect_stdout(log):
+            for payload in payloads:
+                ranger.deliver(t, payload)
+            ranger.step(t, None if angles is None else angles[0])
+            pc.process_frame(lmList, angles, img, t)
+        t4 = time.perf_counter()
+
+        times.add("decode", t1 - t0)
+        if not trace:
+            times.add("pose", t2 - t1)
+        times.add("angles", t3 - t2)
+        times.add("state", t4 - t3)
+        times.add("total", t4 - t0)
+        frames += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "frames": frames,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "pushups": mqtt.count(proto.PUSHUP_COUNTED),
+        "attempts": sum(1 for _, p in ranger.received if p == proto.ATTEMPT_COUNTED),
+        "snapshots": pc.snapshots.taken,
+        "sessions": len(pc.firestore_mgr.sessions),
+        "stages": times,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded push-up session through the counter.")
+    parser.add_argument("source", help="Video file or landmark trace to replay")
+    parser.add_argument("--labels", help="JSON ground truth (pushups, attempts, events)")
+    parser.add_argument("--no-roi", action="store_true", help="Run inference on the full frame")
+    parser.add_argument("--verbose", action="store_true", help="Show the counter's own prints")
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    results = run(args.source, labels, use_roi=not args.no_roi, verbose=args.verbose)
+
+    print(f"Frames: {results['frames']}  End-to-end: {results['fps']:.1f} FPS")
+    print(results["stages"].report())
+    print(f"Snapshots: {results['snapshots']}  Sessions uploaded: {results['sessions']}")
+
+    ok = True
+    for key in ("pushups", "attempts"):
+        line = f"{key.capitalize()}: {results[key]}"
+        if labels and key in labels:
+            match = results[key] == labels[key]
+            ok = ok and match
+            line += f" (expected {labels[key]}{'' if match else ', MISMATCH'})"
+        print(line)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
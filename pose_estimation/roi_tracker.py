@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+
+class RoiTracker:
+    """Crops and downscales the pose input to the area around the person found in the previous frame.
+
+    MediaPipe's landmark model works on a 256 px crop internally, so feeding it a region that is
+    already about that size costs no accuracy, while the colour conversion and detection run on
+    far fewer pixels. When the pose is lost or its key points become unreliable the tracker falls
+    back to a full-frame detect on the next call.
+    """
+
+    def __init__(self, target_size=256, full_frame_size=480, margin=0.25, min_visibility=0.5,
+                 key_points=(11, 13, 15, 23, 25), min_roi=96):
+        """
+        Args:
+            target_size: Longest side (px) the ROI crop is downscaled to
+            full_frame_size: Longest side (px) for full-frame detects
+            margin: Padding added around the landmark bounding box, as a fraction of its size
+            min_visibility: Mean key point visibility below which the ROI is dropped
+            key_points: Landmarks that must stay visible for the ROI to be trusted
+            min_roi: Smallest ROI side (px), avoids collapsing onto a partial detection
+        """
+        self.target_size = target_size
+        self.full_frame_size = full_frame_size
+        self.margin = margin
+        self.min_visibility = min_visibility
+        self.key_points = list(key_points)
+        self.min_roi = min_roi
+        self.roi = None  # (x0, y0, x1, y1) in full-frame pixels, None means full frame
+
+    def reset(self):
+        self.roi = None
+
+    def crop(self, img):
+        """Returns the image to run inference on and the (x0, y0, w, h) region it covers."""
+        h, w = img.shape[:2]
+        if self.roi is None:
+            x0, y0, x1, y1 = 0, 0, w, h
+            limit = self.full_frame_size
+        else:
+            x0, y0, x1, y1 = self.roi
+            limit = self.target_size
+
+        region = img[y0:y1, x0:x1]
+        cw, ch = x1 - x0, y1 - y0
+        scale = limit / max(cw, ch)
+        if scale < 1:
+            region = cv2.resize(region, (max(1, int(cw * scale)), max(1, int(ch * scale))),
+                                interpolation=cv2.INTER_AREA)
+        return region, (x0, y0, cw, ch)
+
+    def update(self, landmarks, frame_shape):
+        """Moves the ROI to follow the full-frame landmark array (rows of x, y, z, visibility)."""
+        if len(landmarks) == 0:
+            self.roi = None
+            return
+
+        if landmarks[self.key_points, 3].mean() < self.min_visibility:
+            self.roi = None
+            return
+
+        h, w = frame_shape[:2]
+        visible = landmarks[landmarks[:, 3] > self.min_visibility]
+        if len(visible) == 0:
+            visible = landmarks
+        bx0, by0 = visible[:, 0].min(), visible[:, 1].min()
+        bx1, by1 = visible[:, 0].max(), visible[:, 1].max()
+
+        # Keep the current ROI while the person is comfortably inside it, so MediaPipe's
+        # own frame-to-frame tracking sees a stable crop
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            pad = self.margin / 2 * max(bx1 - bx0, by1 - by0)
+            if bx0 - pad >= x0 and by0 - pad >= y0 and bx1 + pad <= x1 and by1 + pad <= y1:
+                return
+
+        # Square box around the person, padded by the margin and clamped to the frame
+        side = max(bx1 - bx0, by1 - by0, self.min_roi) * (1 + 2 * self.margin)
+        cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+        x0 = int(np.clip(cx - side / 2, 0, w))
+        y0 = int(np.clip(cy - side / 2, 0, h))
+        x1 = int(np.clip(cx + side / 2, 0, w))
+        y1 = int(np.clip(cy + side / 2, 0, h))
+
+        if x1 - x0 < self.min_roi or y1 - y0 < self.min_roi or (x1 - x0 >= w and y1 - y0 >= h):
+            self.roi = None
+        else:
+            self.roi = (x0, y0, x1, y1)
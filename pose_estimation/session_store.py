@@ -0,0 +1,282 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    ended REAL NOT NULL,               -- When the session ended (epoch seconds)
+    stats TEXT NOT NULL,               -- Session stats as JSON
+    bad_form_count INTEGER NOT NULL DEFAULT 0,
+    telemetry BLOB,                    -- Columnar per-frame angles, see rep_telemetry
+    changed INTEGER NOT NULL           -- Change sequence number, see SessionStore.next_change
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    session_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    counted INTEGER NOT NULL,
+    issue TEXT,                        -- Last form issue seen during the attempt
+    started REAL,
+    ended REAL NOT NULL,
+    min_elbow REAL,
+    min_shoulder REAL,
+    min_hip REAL,
+    max_hip REAL,
+    changed INTEGER NOT NULL,
+    PRIMARY KEY (session_id, number)
+);
+CREATE TABLE IF NOT EXISTS images (
+    session_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,              -- Position in the session's image list
+    path TEXT NOT NULL,
+    thumbnail BLOB,                    -- Upload JPEG, read back from path if there was no snapshot writer
+    full BLOB,                         -- Full resolution JPEG, only when enabled
+    changed INTEGER NOT NULL,
+    PRIMARY KEY (session_id, idx)
+);
+CREATE INDEX IF NOT EXISTS sessions_changed ON sessions(changed);
+CREATE INDEX IF NOT EXISTS attempts_changed ON attempts(changed);
+CREATE INDEX IF NOT EXISTS images_changed ON images(changed);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    watermark INTEGER NOT NULL         -- Every change up to this one is in Firestore
+);
+"""
+
+TABLES = ("sessions", "attempts", "images")
+
+
+class SessionStore:
+    """Local SQLite database of sessions, attempts and bad form images, synced to Firestore.
+
+    The frame loop only ever writes here, one small transaction per attempt or session, so the
+    station keeps working with no network at all. Every row carries a change sequence number and
+    a background sync thread pushes the rows changed since its watermark to Firestore, advancing
+    the watermark as they land. Nothing is pulled back, the Pi is the only writer of its sessions.
+    """
+
+    def __init__(self, firestore_mgr, path="sessions.db", user_id="testing",
+                 retry_base=5.0, retry_max=300.0, batch_size=200):
+        """
+        Args:
+            firestore_mgr: FirestoreManager used for the sync, reconnected while it is not initialized
+            path: SQLite database file
+            user_id: Username the sessions are stored under
+            retry_base: Seconds before the first retry, doubled after every failed sync
+            retry_max: Longest wait between retries
+            batch_size: Most rows pushed per sync round
+        """
+        self.firestore_mgr = firestore_mgr
+        self.user_id = user_id
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.batch_size = batch_size
+
+        # One connection shared by both threads, every use is under the lock
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # WAL is still crash-safe, just not power-loss durable per commit
+        self.db.executescript(SCHEMA)
+        if "telemetry" not in [column[1] for column in self.db.execute("PRAGMA table_info(sessions)")]:
+            self.db.execute("ALTER TABLE sessions ADD COLUMN telemetry BLOB")  # Store from an older version
+        self.lock = threading.Lock()
+        self.change = max(self.db.execute(f"SELECT COALESCE(MAX(changed), 0) FROM {table}").fetchone()[0]
+                          for table in TABLES)
+
+        self.wake = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.sync_loop, name="session-sync", daemon=True)
+        self.thread.start()
+
+        pending = self.pending()
+        if pending:
+            print(f"Session store: {pending} change(s) not synced yet, syncing in the background")
+
+    def next_change(self):
+        """Next change sequence number, only called under the lock."""
+        self.change += 1
+        return self.change
+
+    # Local writes (frame loop)
+    def add_attempt(self, record):
+        """Stores one finished attempt (a PushupSession.attempt_record dict)."""
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO attempts (session_id, number, counted, issue, started, ended, "
+                "min_elbow, min_shoulder, min_hip, max_hip, changed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["session_id"], record["number"], int(record["counted"]), record["issue"],
+                 record["started"], record["ended"], record["min_elbow"], record["min_shoulder"],
+                 record["min_hip"], record["max_hip"], self.next_change()))
+
+    def end_session(self, session_stats, image_paths, session_id, telemetry=None, images=None):
+        """Stores a finished session, its rep telemetry blob and its bad form images.
+
+        images maps paths to the snapshot writer's EncodedImages. They are written in the same
+        transaction as the session, so no snapshot is only held in memory once this returns.
+        Paths found neither there nor on disk (duplicates, failed encodes) are left out.
+        """
+        ended = session_stats.get("timestamp") or time.time()
+        images = images or {}
+        image_paths = [path for path in image_paths if path in images or os.path.exists(path)]
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, user_id, ended, stats, bad_form_count, telemetry, "
+                "changed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, self.user_id, ended, json.dumps(session_stats), len(image_paths), telemetry,
+                 self.next_change()))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO images (session_id, idx, path, thumbnail, full, changed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, idx, path, images[path].thumbnail if path in images else None,
+                  images[path].full if path in images else None, self.next_change())
+                 for idx, path in enumerate(image_paths)])
+            self.db.execute("COMMIT")
+        self.wake.set()
+
+    # Sync (background thread)
+    def watermark(self):
+        row = self.db.execute("SELECT watermark FROM sync_state WHERE name = 'firestore'").fetchone()
+        return row[0] if row else 0
+
+    def pending(self):
+        """Number of changed rows not in Firestore yet."""
+        with self.lock:
+            mark = self.watermark()
+            return sum(self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE changed > ?", (mark,)).fetchone()[0]
+                       for table in TABLES)
+
+    def changed_rows(self):
+        """Returns ([(change, collection, document ID, data)], last change looked at) of the next rows to push.
+
+        Rows come in change order, so the watermark never passes a row that has not been pushed.
+        """
+        with self.lock:
+            mark = self.watermark()
+            rows = []
+            for session_id, user_id, ended, stats, bad_form_count, telemetry, change in self.db.execute(
+                    "SELECT session_id, user_id, ended, stats, bad_form_count, telemetry, changed FROM sessions "
+                    "WHERE changed > ? ORDER BY changed LIMIT ?", (mark, self.batch_size)):
+                data = {
+                    'username': user_id,
+                    'session_id': session_id,
+                    'timestamp': datetime.datetime.fromtimestamp(ended),
+                    'stats': json.loads(stats),
+                    'bad_form_count': bad_form_count,
+                    'completed': True
+                }
+                if telemetry:
+                    data['telemetry'] = bytes(telemetry)  # One bytes field, not a document per sample
+                rows.append((change, "sessions", session_id, data))
+            for (session_id, number, counted, issue, started, ended, min_elbow, min_shoulder, min_hip,
+                 max_hip, change) in self.db.execute(
+                    "SELECT session_id, number, counted, issue, started, ended, min_elbow, min_shoulder, "
+                    "min_hip, max_hip, changed FROM attempts WHERE changed > ? ORDER BY changed LIMIT ?",
+                    (mark, self.batch_size)):
+                rows.append((change, "attempts", f"{session_id}-a{number}", {
+                    'username': self.user_id,
+                    'session_id': session_id,
+                    'timestamp': datetime.datetime.fromtimestamp(ended),
+                    'attempt_number': number,
+                    'counted': bool(counted),
+                    'form_issue': issue,
+                    'duration': ended - started if started else None,
+                    'min_elbow': min_elbow,
+                    'min_shoulder': min_shoulder,
+                    'min_hip': min_hip,
+                    'max_hip': max_hip
+                }))
+            for session_id, idx, path, thumbnail, full, change in self.db.execute(
+                    "SELECT session_id, idx, path, thumbnail, full, changed FROM images "
+                    "WHERE changed > ? ORDER BY changed LIMIT ?", (mark, self.batch_size)):
+                rows.append((change, "wrong_forms", f"{session_id}-{idx}", (session_id, path, thumbnail, full)))
+            ended = dict(self.db.execute("SELECT session_id, ended FROM sessions"
+                                         " WHERE session_id IN (SELECT session_id FROM images WHERE changed > ?)",
+                                         (mark,)).fetchall())
+        rows.sort(key=lambda row: row[0])
+        rows = rows[:self.batch_size]
+
+        documents, last = [], mark
+        for change, collection, doc_id, data in rows:
+            if collection == "wrong_forms":
+                data = self.wrong_form(*data, ended.get(data[0], time.time()))
+                if isinstance(data, str):
+                    print(f"Session store: skipping image {doc_id}: {data}")
+                    last = change
+                    continue  # Unreadable, nothing a retry would fix
+            documents.append((change, collection, doc_id, data))
+            last = change
+        return documents, last
+
+    def wrong_form(self, session_id, path, thumbnail, full, ended):
+        """Builds a wrong_forms document, same fields as FirestoreManager.send_to_firebase writes."""
+        payload = self.firestore_mgr.prepare_image(path, {path: bytes(thumbnail)} if thumbnail else None)
+        if isinstance(payload, str):
+            return payload
+        attempt_num, issue_type, jpeg = payload
+        data = {
+            'username': self.user_id,
+            'session_id': session_id,
+            'timestamp': datetime.datetime.fromtimestamp(ended),
+            'form_issue': issue_type,
+            'attempt_number': attempt_num,
+            'image_path': path,
+            'image': jpeg
+        }
+        if full:
+            data['image_full'] = bytes(full)
+        return data
+
+    def sync_once(self):
+        """Pushes one round of changes. Returns True if everything pushed landed."""
+        if not self.firestore_mgr.connect():
+            return False
+        documents, last = self.changed_rows()
+        errors = self.firestore_mgr.write_documents([document[1:] for document in documents]) if documents else []
+
+        # Watermark moves up to the first failure, everything after it is pushed again next round
+        failed = next((i for i, error in enumerate(errors) if error), None)
+        if failed is not None:
+            last = documents[failed - 1][0] if failed else None
+        if last is not None:
+            with self.lock:
+                self.db.execute("INSERT OR REPLACE INTO sync_state (name, watermark) VALUES ('firestore', MAX(?, "
+                                "COALESCE((SELECT watermark FROM sync_state WHERE name = 'firestore'), 0)))", (last,))
+        pushed = len(documents) if failed is None else failed
+        if pushed:
+            print(f"Session store: synced {pushed} document(s)")
+        if failed is not None:
+            print(f"Session store: sync failed at {documents[failed][2]} ({errors[failed]})")
+            return False
+        return True
+
+    def sync_loop(self):
+        failures = 0
+        while self.running:
+            try:
+                ok = self.sync_once()
+            except Exception as e:
+                print(f"Session store: sync error: {e}")
+                ok = False
+            if ok:
+                failures = 0
+                if self.pending():
+                    continue  # More than one round's worth waiting
+                delay = self.retry_base
+            else:
+                delay = min(self.retry_max, self.retry_base * 2 ** failures)
+                failures += 1
+            self.wake.wait(timeout=delay)
+            self.wake.clear()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join(timeout=1.0)
+        if not self.thread.is_alive():  # Otherwise a sync is still running, the watermark keeps its place
+            with self.lock:
+                self.db.close()
@@ -0,0 +1,134 @@
+import collections
+import queue
+import threading
+import cv2
+import numpy as np
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a frame, near-identical frames get hashes a few bits apart."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class EncodedImage:
+    """The upload variants of one snapshot, encoded once and kept in memory."""
+
+    __slots__ = ("thumbnail", "full", "digest")
+
+    def __init__(self, thumbnail, full, digest):
+        self.thumbnail = thumbnail  # JPEG bytes, thumb_width wide
+        self.full = full            # Full resolution JPEG bytes, or None unless full_res is on
+        self.digest = digest        # dhash of the frame
+
+
+class SnapshotWriter:
+    """Encodes bad-form snapshots on background worker threads.
+
+    The frame loop only pays for one frame copy when a form fault triggers. The upload thumbnail
+    (and the full resolution variant when enabled) are encoded once on the workers and handed to
+    the uploader as bytes, nothing is read back from disk. Frames that look the same as one
+    already kept for the same attempt are dropped, so a fault held over several frames is
+    uploaded once.
+    """
+
+    def __init__(self, workers=2, max_pending=8, thumb_width=320, thumb_quality=70,
+                 full_res=False, full_quality=90, max_distance=6, max_groups=8):
+        """
+        Args:
+            workers: Number of encoder threads
+            max_pending: Snapshots allowed to wait for a worker before new ones are dropped
+            thumb_width: Width (px) of the upload thumbnail
+            thumb_quality: JPEG quality of the upload thumbnail
+            full_res: Also encode a full resolution variant, and write it to the snapshot path
+                for local review
+            full_quality: JPEG quality of the full resolution variant
+            max_distance: Frames whose hashes differ in at most this many bits are duplicates
+            max_groups: Attempts whose hashes are remembered for duplicate checks
+        """
+        self.thumb_width = thumb_width
+        self.thumb_quality = thumb_quality
+        self.full_res = full_res
+        self.full_quality = full_quality
+        self.max_distance = max_distance
+        self.max_groups = max_groups
+        self.queue = queue.Queue(max_pending)
+        self.images = {}  # image path -> EncodedImage
+        self.groups = collections.OrderedDict()  # group -> hashes kept so far
+        self.duplicates = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.work_loop, name=f"snapshot-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, img, path, group=None):
+        """Copies the frame and queues it for encoding. Returns False if the queue was full.
+
+        group identifies the attempt (and fault), duplicates are only looked for within the same group.
+        """
+        try:
+            self.queue.put_nowait((img.copy(), path, group))
+            return True
+        except queue.Full:
+            print(f"Snapshot queue full, dropped: {path}")
+            return False
+
+    def flush(self):
+        """Blocks until every queued snapshot has been encoded."""
+        self.queue.join()
+
+    def take_images(self, paths):
+        """Returns the EncodedImages for the given paths and forgets them.
+
+        Paths that were dropped as duplicates (or never encoded) are left out.
+        """
+        with self.lock:
+            return {path: self.images.pop(path) for path in paths if path in self.images}
+
+    def is_duplicate(self, group, digest):
+        """Checks digest against the group's kept frames, remembering it if it is new."""
+        with self.lock:
+            hashes = self.groups.get(group)
+            if hashes is None:
+                hashes = self.groups[group] = []
+                if len(self.groups) > self.max_groups:
+                    self.groups.popitem(last=False)
+            if any(bin(digest ^ h).count("1") <= self.max_distance for h in hashes):
+                self.duplicates += 1
+                return True
+            hashes.append(digest)
+            return False
+
+    def work_loop(self):
+        while True:
+            img, path, group = self.queue.get()
+            try:
+                digest = dhash(img)
+                if group is not None and self.is_duplicate(group, digest):
+                    print(f"Snapshot looks like one already kept for this attempt, dropped: {path}")
+                    continue
+
+                full = None
+                if self.full_res:
+                    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.full_quality])
+                    if ok:
+                        full = buffer.tobytes()
+                        with open(path, "wb") as f:
+                            f.write(full)
+
+                # Thumbnail for the Firestore upload
+                height, width = img.shape[:2]
+                if width > self.thumb_width:
+                    scale = self.thumb_width / width
+                    img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.thumb_quality])
+                if ok:
+                    with self.lock:
+                        self.images[path] = EncodedImage(buffer.tobytes(), full, digest)
+            except Exception as e:
+                print(f"Error encoding snapshot {path}: {e}")
+            finally:
+                self.queue.task_done()
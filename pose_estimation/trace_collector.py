@@ -0,0 +1,174 @@
+"""Joins the per-hop trace records of both Pis into rep-to-feedback latency breakdowns.
+
+Run the counter with --trace and the Grove Pi with PUSHUP_TRACE=1, then run this on the camera
+Pi (the broker host). For every message from the camera Pi to the Grove Pi it lines up:
+
+    capture -> counted -> published       camera Pi: frame read, state machine decision, publish
+    -> broker                             this collector receiving the message from the broker
+    -> received -> lcd/buzzer/led/...     Grove Pi: on_message entry, each actuator call finished
+    -> handled
+
+The Grove Pi's times are moved onto the camera Pi's clock with an offset estimated from MQTT
+ping/pong round trips (the sample with the shortest round trip wins, as in NTP).
+
+Usage:
+    python trace_collector.py                  # single station
+    python trace_collector.py --lane 2 -v      # lane 2, print every trace
+"""
+import argparse
+import collections
+import json
+import threading
+import time
+import paho.mqtt.client as mqtt
+import pushup_protocol as proto
+from metrics import RollingHistogram
+
+
+class ClockOffset:
+    """Estimates (Grove Pi clock - camera Pi clock) from ping/pong exchanges."""
+
+    def __init__(self, samples=16):
+        self.samples = collections.deque(maxlen=samples)  # (round trip, offset)
+
+    def add(self, t0, t1, t2, t3):
+        """t0 ping sent and t3 pong received (our clock), t1 ping received and t2 pong sent (theirs)."""
+        rtt = (t3 - t0) - (t2 - t1)
+        self.samples.append((rtt, ((t1 - t0) + (t2 - t3)) / 2))
+
+    @property
+    def offset(self):
+        """Offset in seconds from the lowest round trip sample, or None before the first pong."""
+        return min(self.samples)[1] if self.samples else None
+
+    @property
+    def rtt(self):
+        return min(self.samples)[0] if self.samples else None
+
+
+class TraceCollector:
+    def __init__(self, prefix="", verbose=False, window=512, expire=10.0):
+        self.prefix = prefix
+        self.verbose = verbose
+        self.window = window
+        self.expire = expire  # Seconds to wait for the other Pi's half of a trace
+        self.clock = ClockOffset()
+        self.pending = {}     # trace id -> {"kind", "pi5", "pi3", "broker", "seen"}
+        self.hops = {}        # (kind, hop) -> RollingHistogram of ms since the previous hop
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def on_message(self, client, userdata, message):
+        received_at = time.time()
+        topic = message.topic[len(self.prefix):]
+
+        if topic == proto.CLOCK_PONG_TOPIC:
+            t0, t1, t2 = (float(x) for x in message.payload.decode().split(","))
+            with self.lock:
+                self.clock.add(t0, t1, t2, received_at)
+            return
+
+        if topic == proto.TRACE_TOPIC:
+            record = json.loads(message.payload)
+            self.add(record["id"], record["kind"], src=record["src"], hops=record["hops"])
+            return
+
+        # The traced message itself, stamped on its way through the broker
+        msg = proto.decode(message.payload)
+        if msg.seq is not None:
+            self.add(msg.seq, msg.kind, broker=received_at)
+
+    def add(self, trace_id, kind, src=None, hops=None, broker=None):
+        with self.lock:
+            entry = self.pending.setdefault(trace_id, {"kind": kind, "seen": time.time()})
+            if src:
+                entry[src] = hops
+            if broker:
+                entry["broker"] = broker
+            if "pi5" in entry and "pi3" in entry and self.clock.offset is not None:
+                del self.pending[trace_id]
+                self.complete(trace_id, entry)
+
+    def complete(self, trace_id, entry):
+        """Puts one trace on the camera Pi's clock and adds its hop latencies to the histograms."""
+        offset = self.clock.offset
+        timeline = [tuple(hop) for hop in entry["pi5"]]
+        if "broker" in entry:
+            timeline.append(("broker", entry["broker"]))
+        timeline += [(name, t - offset) for name, t in entry["pi3"]]
+
+        kind = entry["kind"]
+        parts = []
+        for (_, prev), (name, t) in zip(timeline, timeline[1:]):
+            ms = (t - prev) * 1000.0
+            self.histogram(kind, name).add(ms)
+            parts.append(f"{name} {ms:+.1f}")
+        total = (timeline[-1][1] - timeline[0][1]) * 1000.0
+        self.histogram(kind, "total").add(total)
+        self.completed += 1
+        if self.verbose:
+            print(f"{kind} #{trace_id}: " + " | ".join(parts) + f" = {total:.1f} ms")
+
+    def histogram(self, kind, hop):
+        hist = self.hops.get((kind, hop))
+        if hist is None:
+            hist = self.hops[(kind, hop)] = RollingHistogram(self.window)
+        return hist
+
+    def expire_pending(self):
+        now = time.time()
+        with self.lock:
+            for trace_id in [i for i, e in self.pending.items() if now - e["seen"] > self.expire]:
+                del self.pending[trace_id]
+
+    def report(self):
+        with self.lock:
+            offset, rtt = self.clock.offset, self.clock.rtt
+            rows = [(kind, hop, hist.percentiles(), min(hist.total, self.window))
+                    for (kind, hop), hist in self.hops.items()]
+        if offset is None:
+            return "Waiting for the Grove Pi to answer clock pings (is PUSHUP_TRACE=1 set?)"
+
+        lines = [f"Clock offset {offset * 1000:+.1f} ms (round trip {rtt * 1000:.1f} ms), "
+                 f"{self.completed} traces",
+                 f"{'message':<18} {'hop':<16} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+        for kind, hop, (p50, p95, p99), n in rows:
+            lines.append(f"{kind:<18} {hop:<16} {n:5d} {p50:8.1f} {p95:8.1f} {p99:8.1f}")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect and report per-hop latency traces.")
+    parser.add_argument("--lane", type=int, help="Lane to trace in multi-lane mode")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between reports")
+    parser.add_argument("--ping-every", type=float, default=2.0, help="Seconds between clock pings")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every completed trace")
+    args = parser.parse_args()
+
+    prefix = proto.lane_prefix(args.lane)
+    collector = TraceCollector(prefix, args.verbose)
+    client = mqtt.Client("TraceCollector" + (f"-lane{args.lane}" if args.lane else ""))
+    client.on_message = collector.on_message
+    client.connect(proto.BROKER, proto.PORT)
+    for topic in (proto.TRACE_TOPIC, proto.CLOCK_PONG_TOPIC, proto.STATUS_TOPIC, proto.DIRECTION_TOPIC):
+        client.subscribe(prefix + topic, qos=0)
+    client.loop_start()
+
+    next_report = time.time() + args.report_every
+    try:
+        while True:
+            client.publish(prefix + proto.CLOCK_PING_TOPIC, repr(time.time()), qos=0)
+            time.sleep(args.ping_every)
+            collector.expire_pending()
+            if time.time() >= next_report:
+                next_report += args.report_every
+                print(collector.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""MQTT protocol shared by the camera Pi (pose_estimation/) and the Grove Pi (grove/).
+
+Copy this file next to the scripts on both Pis. It must keep running on the Pi 3's Python 3.9.
+
+Every message is one of the kinds below, sent as a short versioned string:
+
+    <version><code><sequence>,<monotonic ms>      e.g. "1C42,183220"
+
+The sequence number lets a receiver drop stale or duplicated messages, and the sender's
+monotonic timestamp survives wall clock jumps. Plain-text payloads from older scripts
+(e.g. "Push up counted") still decode, with no sequence number or timestamp.
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+VERSION = 1
+
+# Broker on the camera Pi's hotspot, PUSHUP_BROKER overrides it
+BROKER = os.environ.get("PUSHUP_BROKER", "172.20.10.4")
+PORT = 1883
+
+# Topics, relative to the lane prefix
+STATUS_TOPIC = "pushup/status"        # Camera Pi -> Grove Pi: session status
+DIRECTION_TOPIC = "pushup/direction"  # Camera Pi -> Grove Pi: which way the user should be moving
+RANGER_TOPIC = "pushup/badposture"    # Grove Pi -> camera Pi: ultrasonic ranger events
+METRICS_TOPIC = "pushup/metrics"      # Camera Pi stage timings (JSON, not a protocol message)
+TRACE_TOPIC = "pushup/trace"          # Both Pis: per-hop latency records (JSON, see HopTrace)
+CLOCK_PING_TOPIC = "pushup/clock/ping"  # Trace collector -> Grove Pi: "<t0>"
+CLOCK_PONG_TOPIC = "pushup/clock/pong"  # Grove Pi -> trace collector: "<t0>,<t1 received>,<t2 sent>"
+
+# Message kinds. The values are the payload texts the scripts used before this module.
+USER_DETECTED = "User detected"
+NO_USER = "No user detected"
+USER_IN_POSITION = "User in position"
+START = "Start"
+PUSHUP_COUNTED = "Push up counted"
+STRAIGHTEN_BACK = "Straighten Back"
+STRAIGHTEN_ARMS = "Straighten Arms"
+END = "End"
+UP = "up"
+DOWN = "down"
+BAD_POSTURE = "Bad posture"
+ATTEMPT_COUNTED = "Attempt counted"
+BOTTOM_REACHED = "Bottom reached"
+
+# One-character wire code per kind
+CODES = {
+    USER_DETECTED: "U",
+    NO_USER: "N",
+    USER_IN_POSITION: "P",
+    START: "S",
+    PUSHUP_COUNTED: "C",
+    STRAIGHTEN_BACK: "B",
+    STRAIGHTEN_ARMS: "A",
+    END: "E",
+    UP: "u",
+    DOWN: "d",
+    BAD_POSTURE: "X",
+    ATTEMPT_COUNTED: "T",
+    BOTTOM_REACHED: "M",
+}
+KINDS = {code: kind for kind, code in CODES.items()}
+
+# QoS per kind. Direction hints are superseded by the next one and the ranger re-sends
+# "Bottom reached" on every reading at the bottom, so losing one costs nothing. Everything else
+# changes what the user sees or what gets counted, so it must arrive, but at most once is not
+# needed (receivers drop duplicates by sequence number), so QoS 1 rather than 2.
+QOS = {UP: 0, DOWN: 0, BOTTOM_REACHED: 0}
+DEFAULT_QOS = 1
+SUBSCRIBE_QOS = 1  # Subscriptions cap delivery QoS, so subscribe at the highest QoS used
+
+Message = namedtuple("Message", ["kind", "seq", "timestamp"])  # timestamp in sender monotonic ms
+
+
+def lane_prefix(lane):
+    """Topic prefix for a lane number (None or "" for a single station)."""
+    return f"lane{lane}/" if lane else ""
+
+
+def encode(kind, seq, timestamp_ms):
+    return f"{VERSION}{CODES[kind]}{seq},{timestamp_ms}"
+
+
+def decode(payload):
+    """Turns a raw payload (bytes or str) into a Message, accepting old plain-text payloads too."""
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8", "replace")
+    if len(payload) > 2 and payload[0] == str(VERSION) and payload[1] in KINDS:
+        seq, _, timestamp = payload[2:].partition(",")
+        try:
+            return Message(KINDS[payload[1]], int(seq), int(timestamp))
+        except ValueError:
+            pass
+    return Message(payload, None, None)
+
+
+class Publisher:
+    """Sends protocol messages on an MQTT client with per-kind QoS.
+
+    Consecutive identical direction hints are coalesced into one message, and the coalescing is
+    reset whenever a session ends so the next session's first hint always goes out.
+    """
+
+    def __init__(self, client, prefix=""):
+        self.client = client
+        self.prefix = prefix
+        self.seq = 0
+        self.last_direction = None
+        self.lock = threading.Lock()  # The Grove Pi publishes from its ranger thread too
+
+    def send(self, topic, kind):
+        """Publishes kind on topic (relative to the lane prefix).
+
+        Returns the message's sequence number, which doubles as its trace ID, or None if the
+        message was coalesced away.
+        """
+        with self.lock:
+            if topic == DIRECTION_TOPIC:
+                if kind == self.last_direction:
+                    return None
+                self.last_direction = kind
+            elif kind == END:
+                self.last_direction = None
+            self.seq += 1
+            seq = self.seq
+            payload = encode(kind, seq, int(time.monotonic() * 1000))
+        self.client.publish(self.prefix + topic, payload, qos=QOS.get(kind, DEFAULT_QOS))
+        return seq
+
+
+class Receiver:
+    """Drops duplicated (QoS 1 redelivery) or out-of-order messages per topic.
+
+    A message is stale when its sequence number is at most a few behind the last one accepted and
+    its timestamp is not newer. A restarted sender starts again from sequence 1 but with a later
+    monotonic timestamp, so it is accepted straight away.
+    """
+
+    REORDER_WINDOW = 16
+
+    def __init__(self):
+        self.last = {}  # topic -> (seq, timestamp) of the newest accepted message
+
+    def accept(self, topic, message):
+        if message.seq is None:
+            return True  # Old plain-text sender, nothing to check
+        last = self.last.get(topic)
+        if last is not None:
+            last_seq, last_timestamp = last
+            if last_seq - self.REORDER_WINDOW < message.seq <= last_seq and message.timestamp <= last_timestamp:
+                return False
+        self.last[topic] = (message.seq, message.timestamp)
+        return True
+
+
+class HopTrace:
+    """Wall clock times at which one message passed each hop on one Pi, published on TRACE_TOPIC.
+
+    The trace ID is the message's sequence number, so the camera Pi's record (frame captured,
+    rep counted, published) and the Grove Pi's record (received, each actuator done, handled)
+    for the same message can be joined by the trace collector.
+    """
+
+    __slots__ = ("trace_id", "source", "kind", "hops")
+
+    def __init__(self, trace_id, source, kind):
+        self.trace_id = trace_id
+        self.source = source  # "pi5" or "pi3"
+        self.kind = kind
+        self.hops = []        # [name, time.time()] in the order they happened
+
+    def mark(self, name, t=None):
+        self.hops.append([name, time.time() if t is None else t])
+
+    def to_json(self):
+        return json.dumps({"id": self.trace_id, "src": self.source, "kind": self.kind, "hops": self.hops})
@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+# The scripts import each other by module name, as they do when run from their own folders on the Pis
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("shared", "pose_estimation", "grove"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+
+def load_script(name, filename):
+    """Imports pose_estimation/<filename> as <name>, for the scripts saved under a different name
+    than the one they are deployed and imported as (e.g. "firestore_manager (1).py")."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "pose_estimation", filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
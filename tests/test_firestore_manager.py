@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("firebase_admin")
+from conftest import load_script
+
+fm = load_script("firestore_manager", "firestore_manager (1).py")
+MiB = 1024 * 1024
+
+
+class FakeDoc:
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class FakeCollection:
+    def document(self, doc_id=None):
+        return FakeDoc(doc_id or "generated")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+
+    def set(self, doc_ref, data):
+        pass
+
+    def commit(self):
+        raise RuntimeError(self.db.error)
+
+
+class FakeDb:
+    def __init__(self, error):
+        self.error = error
+
+    def collection(self, name):
+        return FakeCollection()
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def manager(error="deadline exceeded"):
+    mgr = fm.FirestoreManager.__new__(fm.FirestoreManager)  # No credentials needed
+    mgr.initialized = True
+    mgr.image_workers = 2
+    mgr.db = FakeDb(error)
+    return mgr
+
+
+def write(image=0, full=0):
+    return (None, {"image": b"x" * image, "image_full": b"x" * full}, None)
+
+
+def test_split_batches_respects_write_count():
+    batches = fm.FirestoreManager.split_batches([write() for _ in range(fm.BATCH_LIMIT + 1)])
+    assert [len(batch) for batch in batches] == [fm.BATCH_LIMIT, 1]
+
+
+def test_split_batches_respects_request_size():
+    batches = fm.FirestoreManager.split_batches([write(4 * MiB), write(3 * MiB, 1 * MiB), write(2 * MiB)])
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert fm.FirestoreManager.split_batches([write(20 * MiB)]) == [[write(20 * MiB)]]  # Too big alone, still sent
+
+
+def test_session_failure_reports_every_image():
+    paths = [f"attempt_{i}_Back error_x.jpg" for i in range(1, 4)]
+    thumbnails = {path: b"x" * (4 * MiB) for path in paths}  # Two batches
+    results = manager().send_to_firebase(paths, {"total_pushups": 3}, thumbnails=thumbnails, session_id="s1")
+    assert not results["success"]
+    assert results["failed_uploads"] == 3
+    assert results["documents"] == {path: "deadline exceeded" for path in paths}
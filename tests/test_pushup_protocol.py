@@ -0,0 +1,52 @@
+import pytest
+
+import pushup_protocol as proto
+
+
+class RecordingClient:
+    def __init__(self):
+        self.sent = []
+
+    def publish(self, topic, payload, qos=0):
+        self.sent.append((topic, payload, qos))
+
+
+@pytest.mark.parametrize("kind", sorted(proto.CODES))
+def test_every_kind_round_trips(kind):
+    assert proto.decode(proto.encode(kind, 42, 183220).encode()) == proto.Message(kind, 42, 183220)
+
+
+def test_plain_text_payloads_still_decode():
+    assert proto.decode(b"Push up counted") == proto.Message(proto.PUSHUP_COUNTED, None, None)
+    assert proto.decode("1Cx,1") == proto.Message("1Cx,1", None, None)  # Looks versioned, isn't
+
+
+def test_publisher_qos_prefix_and_coalescing():
+    client = RecordingClient()
+    publisher = proto.Publisher(client, proto.lane_prefix(2))
+    assert publisher.send(proto.DIRECTION_TOPIC, proto.DOWN) == 1
+    assert publisher.send(proto.DIRECTION_TOPIC, proto.DOWN) is None  # Same hint again
+    assert publisher.send(proto.STATUS_TOPIC, proto.END) == 2
+    assert publisher.send(proto.DIRECTION_TOPIC, proto.DOWN) == 3     # New session, sent again
+    topics = [topic for topic, _, _ in client.sent]
+    assert topics == ["lane2/pushup/direction", "lane2/pushup/status", "lane2/pushup/direction"]
+    assert [qos for _, _, qos in client.sent] == [0, 1, 0]
+    assert [proto.decode(payload).seq for _, payload, _ in client.sent] == [1, 2, 3]
+
+
+def test_receiver_drops_duplicates_and_stale_messages():
+    receiver = proto.Receiver()
+    topic = proto.STATUS_TOPIC
+    assert receiver.accept(topic, proto.Message(proto.START, 5, 1000))
+    assert not receiver.accept(topic, proto.Message(proto.START, 5, 1000))         # QoS 1 redelivery
+    assert not receiver.accept(topic, proto.Message(proto.USER_IN_POSITION, 4, 990))  # Overtaken
+    assert receiver.accept(topic, proto.Message(proto.END, 6, 1010))
+    assert receiver.accept(proto.DIRECTION_TOPIC, proto.Message(proto.UP, 3, 900))  # Topics are separate
+    assert receiver.accept(topic, proto.Message(proto.END, None, None))              # Old sender
+
+
+def test_receiver_accepts_a_restarted_sender():
+    receiver = proto.Receiver()
+    topic = proto.STATUS_TOPIC
+    assert receiver.accept(topic, proto.Message(proto.START, 500, 9000))
+    assert receiver.accept(topic, proto.Message(proto.USER_DETECTED, 1, 9500))  # Sequence reset, later clock
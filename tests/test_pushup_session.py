@@ -0,0 +1,131 @@
+import pushup_protocol as proto
+from pushup_session import (ATTEMPT, END, PUBLISH, SNAPSHOT, STATUS_TOPIC, PresenceTracker,
+                            PushupSession, SessionState)
+
+UP = (170.0, 60.0, 170.0)      # elbow, shoulder, hip
+BOTTOM = (80.0, 20.0, 170.0)
+HALFWAY = (120.0, 40.0, 170.0)
+
+
+class Driver:
+    """Feeds a PushupSession frames at 10 FPS and keeps every action it returns."""
+
+    def __init__(self):
+        self.session = PushupSession()
+        self.t = 0.0
+        self.actions = []
+
+    def frame(self, angles, *events):
+        self.t += 0.1
+        out = self.session.step(angles, list(events), self.t)
+        self.actions += out
+        return out
+
+    def get_ready(self):
+        for _ in range(20):
+            self.frame(UP)
+        assert self.session.state == SessionState.GOING_DOWN
+
+    def of(self, kind):
+        return [action for action in self.actions if action[0] == kind]
+
+
+def test_walk_by_publishes_end_but_stores_nothing():
+    d = Driver()
+    for _ in range(5):
+        d.frame(HALFWAY)
+    for _ in range(15):
+        d.frame(None)
+    assert (PUBLISH, STATUS_TOPIC, proto.END) in d.actions
+    assert d.of(END) == []
+    assert d.session.state == SessionState.NO_USER
+
+
+def test_counted_rep():
+    d = Driver()
+    d.get_ready()
+    d.frame(BOTTOM)
+    assert d.session.timer_started and d.session.state == SessionState.GOING_UP
+    d.frame(HALFWAY)
+    d.frame(UP, proto.ATTEMPT_COUNTED)
+    assert d.session.count == 1
+    [(_, record)] = d.of(ATTEMPT)
+    assert (record["number"], record["counted"]) == (1, True)
+    assert record["min_elbow"] == BOTTOM[0]
+
+
+def test_aborted_attempts_get_their_own_numbers():
+    d = Driver()
+    d.get_ready()
+    for _ in range(2):
+        d.frame(HALFWAY, proto.BAD_POSTURE)  # Turned back before the bottom
+        assert d.session.state == SessionState.GOING_UP
+        d.frame(HALFWAY, proto.BAD_POSTURE)  # Went down again before the top
+        assert d.session.state == SessionState.GOING_DOWN
+    d.frame(BOTTOM)
+    d.frame(UP, proto.ATTEMPT_COUNTED)
+
+    records = [action[1] for action in d.of(ATTEMPT)]
+    assert [(r["number"], r["counted"]) for r in records] == [(1, False), (2, False), (3, True)]
+    # Every snapshot is filed under the attempt it was taken in (0-based)
+    assert sorted({action[2] for action in d.of(SNAPSHOT)}) == [0, 1]
+
+
+def test_leaving_ends_the_session_once():
+    d = Driver()
+    d.get_ready()
+    d.frame(BOTTOM)
+    d.frame(UP, proto.ATTEMPT_COUNTED)
+    for _ in range(30):
+        d.frame(None)
+    [(_, stats, images, session_id, telemetry)] = d.of(END)
+    assert stats["total_pushups"] == 1 and stats["total_attempts"] == 1
+    assert len(stats["reps"]) == 1 and telemetry[:4] == b"PUTL"
+    assert d.session.session_id != session_id  # Reset for the next user
+
+
+def test_session_ends_after_60_seconds():
+    d = Driver()
+    d.get_ready()
+    d.frame(BOTTOM)
+    start = d.session.timer_start_time
+    while not d.of(END):
+        d.frame(BOTTOM)
+        assert d.t < start + 61
+    assert d.of(END)[0][1]["session_duration"] == 60
+
+
+def test_presence_debounce_keeps_session_through_dropouts():
+    d = Driver()
+    d.get_ready()
+    for _ in range(3):
+        d.frame(None)
+    d.frame(UP)
+    assert d.session.state == SessionState.GOING_DOWN
+    assert (PUBLISH, STATUS_TOPIC, proto.END) not in d.actions
+
+
+def feed(tracker, frames, fps):
+    """Feeds (valid, count) runs of frames at fps, returns the frame indexes where the state flipped."""
+    flips, i = [], 0
+    for valid, count in frames:
+        for _ in range(count):
+            if tracker.update(valid, i / fps):
+                flips.append(i)
+            i += 1
+    return flips
+
+
+def test_presence_needs_a_streak_to_appear():
+    tracker = PresenceTracker()
+    assert feed(tracker, [(True, 1), (False, 1), (True, 2)], fps=30) == [3]
+    assert tracker.present
+
+
+def test_presence_absence_needs_frames_and_seconds():
+    # ~30 FPS: 5 frames is too short, the second also has to pass
+    tracker = PresenceTracker()
+    assert feed(tracker, [(True, 2), (False, 20), (True, 1), (False, 40)], fps=32) == [1, 23 + 32]
+    # 2 FPS: 1 s has passed after 3 frames, but 5 frames are still needed
+    tracker = PresenceTracker()
+    assert feed(tracker, [(True, 2), (False, 10)], fps=2) == [1, 6]
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from reading_buffer import ReadingBuffer
+
+
+def filled(distances, dt=0.1, **kwargs):
+    buffer = ReadingBuffer(**kwargs)
+    for k, distance in enumerate(distances):
+        buffer.add(k * dt, distance)
+    return buffer
+
+
+def test_queries_are_callable():
+    buffer = filled([50.0, 51.0, 52.0, 53.0])
+    assert buffer.latest() == (0.30000000000000004, buffer.filtered[3])
+    assert buffer.latest(raw=True)[1] == 53.0
+    assert buffer.mean(1.0) is not None
+    assert buffer.median(1.0) is not None
+    assert buffer.velocity(1.0) > 0
+
+
+def test_median_filter_rejects_one_bad_echo():
+    buffer = filled([50.0, 50.0, 250.0, 50.0], alpha=1.0)
+    assert list(buffer.medians)[:4] == [50.0, 50.0, 50.0, 50.0]
+    assert max(buffer.filtered[:4]) == 50.0
+
+
+def test_ring_keeps_the_newest_readings():
+    buffer = filled([float(k) for k in range(10)], size=4, median_of=1)
+    times, values = buffer.window(10.0, buffer.raw)
+    assert values == [6.0, 7.0, 8.0, 9.0] and times[0] < times[-1]
+
+
+def test_window_since():
+    buffer = filled([float(k) for k in range(10)], median_of=1)
+    times, _ = buffer.window(10.0, since=0.65)
+    assert len(times) == 3 and times[0] > 0.65
+
+
+def test_slope_of_a_steady_move():
+    buffer = filled([30.0 + 2.5 * k for k in range(6)], median_of=1)  # 25 cm/s away from the sensor
+    rate, error = buffer.slope(1.0)
+    assert abs(rate - 25.0) < 1e-9 and error < 1e-6
+
+
+def test_slope_needs_enough_readings():
+    buffer = filled([30.0, 32.5, 35.0, 37.5, 40.0])
+    assert buffer.slope(1.0, min_readings=6) is None
+    assert buffer.slope(1.0, since=0.25) is None  # Only two readings after the turn
+    assert buffer.slope(1.0, min_readings=3, since=0.05) is not None
+
+
+def test_slope_after_a_turnaround_only_sees_the_new_direction():
+    distances = [50.0 - 2.5 * k for k in range(8)] + [32.5 + 2.5 * k for k in range(1, 5)]
+    buffer = filled(distances, median_of=1)
+    assert buffer.slope(0.8)[0] < 10  # The window still mixes both directions
+    assert abs(buffer.slope(0.8, since=0.75)[0] - 25.0) < 1e-9
+
+
+def test_wait_returns_none_on_timeout():
+    buffer = filled([50.0])
+    started = time.perf_counter()
+    assert buffer.wait(0.0, timeout=0.05) is None  # The only reading is not newer than 0.0
+    assert time.perf_counter() - started >= 0.04
+    assert buffer.wait(-1.0, timeout=0.05) == buffer.latest()
+
+
+def test_wait_wakes_up_on_a_new_reading():
+    buffer = filled([50.0])
+    threading.Timer(0.05, buffer.add, (1.0, 60.0)).start()
+    assert buffer.wait(0.0, timeout=2.0, raw=True) == (1.0, 60.0)
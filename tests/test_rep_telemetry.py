@@ -0,0 +1,54 @@
+import numpy as np
+
+from rep_telemetry import RepTelemetry, from_bytes
+
+
+def record_rep(telemetry, start, angles, counted, dt=0.1):
+    """Adds one frame per elbow angle, dt apart from start, and ends the rep one dt after the last."""
+    for k, elbow in enumerate(angles):
+        telemetry.add(start + k * dt, elbow, 30.0, 170.0, 2)
+    telemetry.end_rep(start + len(angles) * dt, counted)
+
+
+def test_summarize_per_rep():
+    telemetry = RepTelemetry()
+    record_rep(telemetry, 100.0, [170, 150, 120, 85, 120, 150, 170], True)
+    record_rep(telemetry, 100.7, [170, 130, 170], False)
+    first, second = telemetry.summarize()
+    assert first["rep"] == 1 and first["counted"]
+    assert first["min_elbow"] == 85.0
+    assert first["tempo"] == 0.7 and first["descent"] == 0.3 and first["ascent"] == 0.4
+    assert first["time_under_tension"] == 0.3  # 120, 85 and 120 are below 145
+    assert second["rep"] == 2 and not second["counted"] and second["min_elbow"] == 130.0
+
+
+def test_round_trip():
+    telemetry = RepTelemetry()
+    record_rep(telemetry, 50.0, [170, 90, 170], True)
+    telemetry.add_event(50.1, "M")
+    start, columns = from_bytes(telemetry.to_bytes())
+    assert start == 50.0
+    assert np.allclose(columns["t"], [0.0, 0.1, 0.2])
+    assert list(columns["elbow"]) == [170, 90, 170]
+    assert list(columns["event_code"]) == [ord("M")] and list(columns["rep_counted"]) == [1]
+
+
+def test_ring_buffers_keep_the_newest_samples():
+    telemetry = RepTelemetry(capacity=4, event_capacity=2, rep_capacity=2)
+    for k in range(3):
+        record_rep(telemetry, k * 1.0, [170, 100 - k, 170], k != 1)
+    reps = telemetry.summarize()
+    # Rep 1 fell out, only rep 2's last frame is left
+    assert [(rep["rep"], rep["min_elbow"]) for rep in reps] == [(2, 170.0), (3, 98.0)]
+    _, columns = from_bytes(telemetry.to_bytes())
+    assert list(columns["elbow"]) == [170, 170, 98, 170]  # Oldest first
+    assert list(columns["rep_counted"]) == [0, 1]
+
+
+def test_clear_reuses_the_buffers():
+    telemetry = RepTelemetry()
+    record_rep(telemetry, 10.0, [170, 90, 170], True)
+    buffer = telemetry.elbow
+    telemetry.clear()
+    assert telemetry.summarize() == [] and telemetry.elbow is buffer
+    assert from_bytes(telemetry.to_bytes())[1]["t"].size == 0
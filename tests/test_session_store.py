@@ -0,0 +1,114 @@
+import time
+
+from session_store import SessionStore
+from snapshot_writer import EncodedImage
+
+
+class OfflineManager:
+    """FirestoreManager stand-in that never gets a connection."""
+
+    def connect(self):
+        return False
+
+    def prepare_image(self, image_path, thumbnails):
+        parts = image_path.split("_")
+        return parts[1], parts[2], thumbnails[image_path] if thumbnails else b"from disk"
+
+
+class FlakyManager(OfflineManager):
+    """Connects once online is set, and fails the write of the document IDs in fail_once the first time."""
+
+    def __init__(self, fail_once=()):
+        self.online = False
+        self.fail_once = set(fail_once)
+        self.rounds = []  # Document IDs of every write_documents call
+        self.stored = {}
+
+    def connect(self):
+        return self.online
+
+    def write_documents(self, documents):
+        self.rounds.append([doc_id for _, doc_id, _ in documents])
+        errors = []
+        for collection, doc_id, data in documents:
+            if doc_id in self.fail_once:
+                self.fail_once.discard(doc_id)
+                errors.append("unavailable")
+            else:
+                self.stored[doc_id] = data
+                errors.append(None)
+        return errors
+
+
+def wait_synced(store, timeout=5.0):
+    deadline = time.time() + timeout
+    while store.pending() and time.time() < deadline:
+        time.sleep(0.01)
+    return store.pending() == 0
+
+
+def attempt(session_id, number, counted):
+    return {"session_id": session_id, "number": number, "counted": counted, "issue": None,
+            "started": 1.0, "ended": 2.0, "min_elbow": 80.0, "min_shoulder": 20.0,
+            "min_hip": 160.0, "max_hip": 175.0}
+
+
+def test_snapshots_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    kept = {"attempt_1_Back error_x.jpg": EncodedImage(b"thumb", None, 0)}
+    paths = ["attempt_1_Back error_x.jpg", "attempt_1_Back error_y.jpg"]  # The second was a duplicate
+    store = SessionStore(OfflineManager(), path, retry_base=60)
+    store.end_session({"timestamp": 1000.0}, paths, "s1", b"telemetry", kept)
+    store.stop()
+
+    store = SessionStore(OfflineManager(), path, retry_base=60)  # As if the Pi had crashed
+    documents, _ = store.changed_rows()
+    store.stop()
+    by_collection = {}
+    for _, collection, doc_id, data in documents:
+        by_collection.setdefault(collection, {})[doc_id] = data
+    assert by_collection["sessions"]["s1"]["bad_form_count"] == 1
+    assert by_collection["sessions"]["s1"]["telemetry"] == b"telemetry"
+    [image] = by_collection["wrong_forms"].values()
+    assert image["image"] == b"thumb" and image["form_issue"] == "Back error"
+
+
+def test_attempts_are_kept_per_number(tmp_path):
+    store = SessionStore(OfflineManager(), str(tmp_path / "sessions.db"), retry_base=60)
+    for number, counted in ((1, True), (2, False), (3, False)):
+        store.add_attempt(attempt("s1", number, counted))
+    documents, last = store.changed_rows()
+    store.stop()
+    assert [doc_id for _, _, doc_id, _ in documents] == ["s1-a1", "s1-a2", "s1-a3"]
+    assert documents[0][3]["counted"] and last == 3
+
+
+def test_watermark_stops_at_the_first_failed_write(tmp_path):
+    manager = FlakyManager(fail_once={"s1-a2"})
+    store = SessionStore(manager, str(tmp_path / "sessions.db"), retry_base=0.01, retry_max=0.05)
+    for number in (1, 2, 3):
+        store.add_attempt(attempt("s1", number, True))
+    manager.online = True
+    assert wait_synced(store)
+    store.stop()
+    assert manager.rounds[0] == ["s1-a1", "s1-a2", "s1-a3"]
+    assert manager.rounds[1] == ["s1-a2", "s1-a3"]  # Everything after the failure again, s1-a1 not
+    assert sorted(manager.stored) == ["s1-a1", "s1-a2", "s1-a3"]
+
+
+def test_sync_resumes_from_the_watermark_after_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    manager = FlakyManager()
+    manager.online = True
+    store = SessionStore(manager, path, retry_base=0.01, retry_max=0.05)
+    store.add_attempt(attempt("s1", 1, True))
+    assert wait_synced(store)
+    store.stop()
+
+    manager = FlakyManager()
+    store = SessionStore(manager, path, retry_base=0.01, retry_max=0.05)
+    store.add_attempt(attempt("s1", 2, False))
+    manager.online = True
+    assert wait_synced(store)
+    store.stop()
+    assert manager.rounds == [["s1-a2"]]